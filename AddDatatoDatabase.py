@@ -1,14 +1,12 @@
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import db
-
-cred = credentials.Certificate("serviceAccountKey.json")
-firebase_admin.initialize_app(cred, {
-    'databaseURL': "your-database-url"  # Replace with your actual database URL
-})
-
-ref = db.reference('Students')
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from datetime import datetime
 
+# Sample roster, imported when no file is given
 data = {
     "57": {
         "name": "Prabesh Bashyal",
@@ -33,6 +31,245 @@ data = {
     }
 }
 
+# field -> (type, required, format for strptime or None)
+SCHEMA = {
+    "name": (str, True, None),
+    "starting_year": (str, True, "%Y-%m"),
+    "total_attendance": (int, False, None),
+    "year": (int, True, None),
+    "last_attendance_time": (str, False, "%Y-%m-%d %H:%M:%S"),
+}
+ID_FIELDS = ("id", "student_id")
+# Maintained by the kiosks once a student exists, so only written for new students
+CREATE_ONLY_FIELDS = ("total_attendance", "last_attendance_time")
+
+
+def init_firebase(credentials_path="serviceAccountKey.json", database_url="your-database-url"):
+    """Initialize the default Firebase app and return the firebase_admin.db module"""
+    import firebase_admin
+    from firebase_admin import credentials
+    from firebase_admin import db
+
+    cred = credentials.Certificate(credentials_path)
+    firebase_admin.initialize_app(cred, {
+        'databaseURL': database_url  # Replace with your actual database URL
+    })
+    return db
+
+
+def read_roster(path):
+    """Yield (student_id, raw record) from a CSV, JSON Lines or JSON file
+
+    CSV and JSON Lines are streamed row by row. A .json file may be an
+    object keyed by student id (the layout of the Students node) or a list
+    of records with an "id" field; it is loaded whole.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                yield _split_id(row)
+    elif ext in ('.jsonl', '.ndjson'):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield _split_id(json.loads(line))
+    elif ext == '.json':
+        with open(path, encoding='utf-8') as f:
+            roster = json.load(f)
+        if isinstance(roster, dict):
+            yield from roster.items()
+        else:
+            for row in roster:
+                yield _split_id(row)
+    else:
+        raise ValueError(f"Unsupported roster format: {path} (expected .csv, .json or .jsonl)")
+
+
+def _split_id(row):
+    row = dict(row)
+    for field in ID_FIELDS:
+        if field in row:
+            return row.pop(field), row
+    return None, row
+
+
+def to_int(value):
+    """int() that refuses to truncate: 4, 4.0 and "4" are accepted, 4.5 and "4.5" are not"""
+    if isinstance(value, bool):
+        raise ValueError("not an integer")
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError("not an integer")
+        return int(value)
+    return int(value)
+
+
+def validate(student_id, raw):
+    """Return (student_id, record, errors); CSV strings are converted to the schema types"""
+    errors = []
+    student_id = str(student_id).strip() if student_id is not None else ''
+    if not student_id:
+        errors.append("missing id")
+    elif any(c in student_id for c in '.$#[]/'):
+        errors.append(f"id {student_id!r} contains characters not allowed in database keys")
+
+    record = {}
+    for field, value in raw.items():
+        if field not in SCHEMA:
+            errors.append(f"unknown field {field!r}")
+            continue
+        if value is None or value == '':
+            continue  # empty CSV cell: treat as absent
+        kind, _, fmt = SCHEMA[field]
+        try:
+            value = value.strip() if isinstance(value, str) else value
+            value = to_int(value) if kind is int else kind(value)
+            if fmt is not None:
+                datetime.strptime(value, fmt)
+        except (TypeError, ValueError):
+            expected = fmt or kind.__name__
+            errors.append(f"{field}={value!r} is not {expected}")
+            continue
+        record[field] = value
+
+    for field, (_, required, _) in SCHEMA.items():
+        if required and raw.get(field) in (None, ''):
+            errors.append(f"missing {field}")
+    return student_id, record, errors
+
+
+def _existing_ids(node):
+    if isinstance(node, list):
+        return {str(i) for i, record in enumerate(node) if record is not None}
+    return set(node or {})
+
+
+def diff_record(record, existing):
+    """Fields of record whose values differ from the existing record"""
+    if not isinstance(existing, dict):
+        return dict(record)
+    return {field: value for field, value in record.items() if existing.get(field) != value}
+
+
+def import_records(db, records, root='Students', chunk_size=500, dry_run=False, diff=False,
+                   progress_interval=2.0):
+    """Validate records and write them with one multi-path update per chunk
+
+    Only the fields in the roster are written (as "id/field" paths), so
+    fields the roster lacks are kept. Attendance fields (CREATE_ONLY_FIELDS)
+    are only written for students not yet in the database; for existing
+    students the kiosks' counts win. With diff, the existing node is read
+    once and only changed fields are written; otherwise only its keys are
+    read. Returns a dict of counts; db may be None for a dry run without diff.
+    """
+    ref = db.reference(root) if db is not None else None
+    existing = {}
+    known = None  # ids already in the database; None when it is not read
+    if diff:
+        existing = ref.get() or {}
+        if isinstance(existing, list):
+            existing = {str(i): record for i, record in enumerate(existing) if record is not None}
+        known = set(existing)
+        print(f"Loaded {len(existing)} existing students to diff against")
+    elif ref is not None:
+        known = _existing_ids(ref.get(shallow=True))
+
+    counts = {"read": 0, "invalid": 0, "new": 0, "changed": 0, "unchanged": 0, "written": 0, "updates": 0,
+              "attendance_kept": 0}
+    updates = {}
+    chunk_records = 0
+    seen = set()
+    start = last_report = time.perf_counter()
+
+    def flush():
+        nonlocal updates, chunk_records
+        if updates and not dry_run:
+            ref.update(updates)
+            counts["updates"] += 1
+        counts["written"] += chunk_records
+        updates, chunk_records = {}, 0
+
+    for raw_id, raw in records:
+        counts["read"] += 1
+        student_id, record, errors = validate(raw_id, raw)
+        if not errors and student_id in seen:
+            errors.append("duplicate id in roster")
+        if errors:
+            counts["invalid"] += 1
+            print(f"Invalid record {counts['read']} ({student_id or '?'}): {'; '.join(errors)}")
+            continue
+        seen.add(student_id)
+
+        if known is not None and student_id in known:
+            kept = [field for field in CREATE_ONLY_FIELDS if field in record]
+            if kept:
+                counts["attendance_kept"] += 1
+                record = {field: value for field, value in record.items() if field not in kept}
+
+        changes = diff_record(record, existing.get(student_id)) if diff else record
+        if diff and student_id not in existing:
+            counts["new"] += 1
+        elif diff and not changes:
+            counts["unchanged"] += 1
+            continue
+        elif diff:
+            counts["changed"] += 1
+        for field, value in changes.items():
+            updates[f"{student_id}/{field}"] = value
+        chunk_records += 1
+        if chunk_records >= chunk_size:
+            flush()
+
+        now = time.perf_counter()
+        if now - last_report >= progress_interval:
+            last_report = now
+            print(f"{counts['read']} read, {counts['written']} written "
+                  f"({counts['read'] / (now - start):.0f} records/sec)")
+    flush()
+
+    elapsed = time.perf_counter() - start
+    counts["seconds"] = elapsed
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import a student roster into the database")
+    parser.add_argument('roster', nargs='?', help="CSV, JSON or JSON Lines roster (default: the sample students)")
+    parser.add_argument('--chunk-size', type=int, default=500, help="students per multi-path update")
+    parser.add_argument('--dry-run', action='store_true', help="validate and report without writing")
+    parser.add_argument('--diff', action='store_true', help="only write fields that differ from the database")
+    args = parser.parse_args(argv)
+
+    records = read_roster(args.roster) if args.roster else iter(data.items())
+    # A dry run reads the existing ids too, so it reports what a real import would write;
+    # without credentials it still validates the roster
+    try:
+        db = init_firebase()
+    except Exception as e:
+        if args.diff or not args.dry_run:
+            print(f"Error importing students: {e}")
+            return 1
+        print(f"Warning: database unavailable ({e}); validating only, existing students are not checked")
+        db = None
+    try:
+        counts = import_records(db, records, chunk_size=args.chunk_size, dry_run=args.dry_run, diff=args.diff)
+    except Exception as e:
+        print(f"Error importing students: {e}")
+        return 1
+
+    verb = "would be written" if args.dry_run else "written"
+    rate = counts["read"] / counts["seconds"] if counts["seconds"] else 0.0
+    summary = f"{counts['read']} read, {counts['invalid']} invalid, {counts['written']} {verb}"
+    if args.diff:
+        summary += f" ({counts['new']} new, {counts['changed']} changed, {counts['unchanged']} unchanged)"
+    print(f"Import Complete: {summary} in {counts['updates']} updates, "
+          f"{counts['seconds']:.1f}s ({rate:.0f} records/sec)")
+    if counts["attendance_kept"]:
+        print(f"Kept the recorded attendance of {counts['attendance_kept']} existing students "
+              f"(roster attendance fields only apply to new students)")
+    return 1 if counts["invalid"] else 0
+
 
-for key, value in data.items():
-    ref.child(key).set(value)
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+import os
+import sys
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+from datetime import date, datetime, timedelta
+
+DEFAULT_HISTORY_PATH = 'attendance_history.db'
+LOG_ROOT = 'AttendanceLog'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    key TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    student_id TEXT NOT NULL,
+    distance REAL,
+    camera TEXT,
+    kiosk TEXT
+);
+CREATE INDEX IF NOT EXISTS events_date_student ON events (date, student_id);
+CREATE INDEX IF NOT EXISTS events_student_date ON events (student_id, date);
+-- One row per student per day, kept in step with events, so reports never scan raw events
+CREATE TABLE IF NOT EXISTS daily (
+    date TEXT NOT NULL,
+    student_id TEXT NOT NULL,
+    first_time TEXT NOT NULL,
+    last_time TEXT NOT NULL,
+    marks INTEGER NOT NULL,
+    PRIMARY KEY (date, student_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS daily_student ON daily (student_id, date);
+"""
+
+
+def event_key(now=None):
+    """Unique, time-ordered key for an attendance event; reused on retries so writes stay idempotent"""
+    now = time.time() if now is None else now
+    return f"{int(now * 1000):013d}-{os.urandom(3).hex()}"
+
+
+def default_kiosk():
+    return safe_key(socket.gethostname())
+
+
+def safe_key(name):
+    """Realtime Database keys may not contain . $ # [ ] /"""
+    return ''.join('_' if c in '.$#[]/' else c for c in str(name)) or 'unknown'
+
+
+def log_path(event):
+    """Where an event lives in the database: partitioned by date, then kiosk"""
+    return f"{LOG_ROOT}/{event['time'][:10]}/{safe_key(event['kiosk'])}/{event['key']}"
+
+
+def log_record(event):
+    return {"student_id": event["student_id"], "time": event["time"], "distance": event.get("distance"),
+            "camera": event.get("camera")}
+
+
+class AttendanceHistory:
+    """Local SQLite mirror of the attendance event log
+
+    Events are appended once (keyed by their event key) and folded into a
+    per-day summary in the same transaction, indexed by (date, student),
+    so daily lists and term reports read a few rows per student-day instead
+    of every event.
+    """
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def record(self, events):
+        """Append events (dicts with key, time, student_id, distance, camera, kiosk); duplicates are ignored"""
+        rows = [(e["key"], e["time"][:10], e["time"], str(e["student_id"]), e.get("distance"), e.get("camera"),
+                 e.get("kiosk")) for e in events]
+        if not rows:
+            return 0
+        with self.lock, self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany("INSERT OR IGNORE INTO events VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            added = self.conn.total_changes - before
+            # Recompute only the student-days touched, from the (date, student) index
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO daily "
+                "SELECT date, student_id, MIN(time), MAX(time), COUNT(*) FROM events "
+                "WHERE date = ? AND student_id = ? GROUP BY date, student_id",
+                sorted({(row[1], row[3]) for row in rows}))
+        return added
+
+    def sync(self, db, start, end=None):
+        """Pull the database log for a date range, one date partition per read; returns events added"""
+        added = 0
+        for day in date_range(start, end or date.today().isoformat()):
+            partition = db.reference(f"{LOG_ROOT}/{day}").get() or {}
+            events = [dict(record, key=key, kiosk=kiosk)
+                      for kiosk, records in partition.items() for key, record in (records or {}).items()]
+            added += self.record(events)
+        return added
+
+    def attended_on(self, day):
+        """[(student_id, first_time, last_time, marks)] for one date"""
+        with self.lock:
+            return self.conn.execute("SELECT student_id, first_time, last_time, marks FROM daily "
+                                     "WHERE date = ? ORDER BY student_id", (day,)).fetchall()
+
+    def attendance_rate(self, start, end):
+        """Per student: (student_id, days attended, session days, rate) between two dates
+
+        Session days are the dates on which anyone attended.
+        """
+        with self.lock:
+            (sessions,) = self.conn.execute("SELECT COUNT(DISTINCT date) FROM daily WHERE date BETWEEN ? AND ?",
+                                            (start, end)).fetchone()
+            rows = self.conn.execute("SELECT student_id, COUNT(*) FROM daily WHERE date BETWEEN ? AND ? "
+                                     "GROUP BY student_id ORDER BY student_id", (start, end)).fetchall()
+        return [(student_id, days, sessions, days / sessions) for student_id, days in rows]
+
+    def student_days(self, student_id, start, end):
+        """[(date, first_time, marks)] for one student between two dates"""
+        with self.lock:
+            return self.conn.execute("SELECT date, first_time, marks FROM daily "
+                                     "WHERE student_id = ? AND date BETWEEN ? AND ? ORDER BY date",
+                                     (str(student_id), start, end)).fetchall()
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def date_range(start, end):
+    day = date.fromisoformat(start)
+    last = date.fromisoformat(end)
+    while day <= last:
+        yield day.isoformat()
+        day += timedelta(days=1)
+
+
+def generate_events(n, students=5000, days=120, kiosks=4, seed=0):
+    """Synthetic events spread over students, school days and kiosks, for timing reports"""
+    import random
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 6, 8, 0, 0)
+    for i in range(n):
+        when = start + timedelta(days=rng.randrange(days), seconds=rng.randrange(8 * 3600))
+        yield {"key": f"{i:013d}", "time": when.strftime("%Y-%m-%d %H:%M:%S"),
+               "student_id": str(rng.randrange(students)), "distance": rng.uniform(0.2, 0.55),
+               "camera": "cam0", "kiosk": f"kiosk{rng.randrange(kiosks)}"}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Attendance history reports")
+    parser.add_argument('--db', default=DEFAULT_HISTORY_PATH, help="local history database")
+    sub = parser.add_subparsers(dest='command', required=True)
+    who = sub.add_parser('who', help="students who attended on a date")
+    who.add_argument('date', help="YYYY-MM-DD")
+    rate = sub.add_parser('rate', help="attendance rate per student over a date range")
+    rate.add_argument('start')
+    rate.add_argument('end')
+    student = sub.add_parser('student', help="days one student attended")
+    student.add_argument('student_id')
+    student.add_argument('start')
+    student.add_argument('end')
+    sync = sub.add_parser('sync', help="pull the database log for a date range into the local mirror")
+    sync.add_argument('start')
+    sync.add_argument('end', nargs='?')
+    bench = sub.add_parser('bench', help="fill a history with synthetic events and time the reports")
+    bench.add_argument('--events', type=int, default=1000000)
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        history = AttendanceHistory(args.db)
+        start = time.perf_counter()
+        batch = []
+        for event in generate_events(args.events):
+            batch.append(event)
+            if len(batch) >= 10000:
+                history.record(batch)
+                batch = []
+        history.record(batch)
+        print(f"Loaded {history.count()} events in {time.perf_counter() - start:.1f}s")
+        for name, fn in (("who 2025-02-03", lambda: history.attended_on("2025-02-03")),
+                         ("rate over the term", lambda: history.attendance_rate("2025-01-06", "2025-05-05")),
+                         ("one student", lambda: history.student_days("42", "2025-01-06", "2025-05-05"))):
+            start = time.perf_counter()
+            rows = fn()
+            print(f"{name}: {len(rows)} rows in {(time.perf_counter() - start) * 1000:.1f} ms")
+        return 0
+
+    history = AttendanceHistory(args.db)
+    if args.command == 'who':
+        rows = history.attended_on(args.date)
+        for student_id, first_time, last_time, marks in rows:
+            print(f"{student_id}: {first_time[11:]}-{last_time[11:]} ({marks} marks)")
+        print(f"{len(rows)} students attended on {args.date}")
+    elif args.command == 'rate':
+        for student_id, days, sessions, fraction in history.attendance_rate(args.start, args.end):
+            print(f"{student_id}: {days}/{sessions} days ({fraction:.0%})")
+    elif args.command == 'student':
+        for day, first_time, marks in history.student_days(args.student_id, args.start, args.end):
+            print(f"{day}: first seen {first_time[11:]} ({marks} marks)")
+    elif args.command == 'sync':
+        from recognitionEngine import init_firebase
+        try:
+            added = history.sync(init_firebase(), args.start, args.end)
+        except Exception as e:
+            print(f"Error syncing attendance history: {e}")
+            return 1
+        print(f"Synced {added} new events ({history.count()} total)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
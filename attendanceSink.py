@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, rely on distinct kiosk names
+    fcntl = None
+from metrics import METRICS
+from attendanceHistory import event_key, default_kiosk, safe_key, log_path, log_record
+
+# Shared by every process on the host before logs were named per kiosk
+LEGACY_WAL_PATH = 'attendance_wal.jsonl'
+# How long a student record remembers which marks it has counted; a mark
+# replayed later than this (a kiosk offline for a month) could count twice
+APPLIED_RETENTION_DAYS = 30
+
+
+def _key_ms(key):
+    try:
+        return int(key.split('-', 1)[0])
+    except ValueError:
+        return 0
+
+
+def apply_marks(record, marks, now=None):
+    """Transaction body: count the marks this student record has not counted yet
+
+    The keys of counted marks are kept in applied_marks, so a batch that is
+    sent again (its ack was lost, or the kiosk stopped mid-flush) leaves the
+    count unchanged. Must stay pure: the database may run it more than once.
+    """
+    record = dict(record) if isinstance(record, dict) else {}
+    applied = record.get("applied_marks") or {}
+    new = [mark for mark in marks if mark["key"] not in applied]
+    if not new:
+        return record
+    record["total_attendance"] = (record.get("total_attendance") or 0) + len(new)
+    # Times are "%Y-%m-%d %H:%M:%S", so they compare as strings; a batch run over
+    # old recordings must not move a later kiosk mark back
+    latest = max(mark["time"] for mark in new)
+    if latest > (record.get("last_attendance_time") or ""):
+        record["last_attendance_time"] = latest
+    cutoff = ((time.time() if now is None else now) - APPLIED_RETENTION_DAYS * 86400) * 1000
+    applied = {key: True for key in applied if _key_ms(key) >= cutoff}
+    applied.update((mark["key"], True) for mark in new)
+    record["applied_marks"] = applied
+    return record
+
+
+class FirebaseAttendanceBackend:
+    """Writes attendance marks so that sending a batch twice counts it once
+
+    db is the firebase_admin.db module or anything with the same
+    reference(path).update/transaction API, such as fakeFirebase.FakeDb.
+    Events go to the attendance log (AttendanceLog/<date>/<kiosk>/<key>) in
+    one multi-path update, which is safe to repeat because keys are fixed
+    when the mark is made. Counts are applied in one transaction per
+    student (apply_marks), which skips marks it has already counted and
+    never loses a concurrent kiosk's mark to a read-modify-write race.
+    """
+
+    def __init__(self, db, root='Students'):
+        self.db = db
+        self.root = root
+
+    def write(self, events):
+        """events are dicts with key, student_id, time, kiosk and optionally distance and camera"""
+        if not events:
+            return
+        self.db.reference('/').update({log_path(event): log_record(event) for event in events})
+        by_student = {}
+        for event in events:
+            by_student.setdefault(str(event["student_id"]), []).append(event)
+        for student_id, marks in by_student.items():
+            self.db.reference(f"{self.root}/{student_id}").transaction(
+                lambda record, marks=marks: apply_marks(record, marks))
+
+
+class AttendanceSink:
+    """Queues attendance marks and flushes them in batches on a background thread
+
+    Every mark is appended to a local write-ahead log before it is queued,
+    and acknowledged in the log once the backend accepts it. Marks that were
+    not acknowledged (network down, process killed) are replayed on the next
+    start, so callers can mark and move on without ever waiting on the
+    database. The log is named after the kiosk and locked while the sink
+    runs, so several kiosk processes on one host never share one; sequence
+    numbers and acks are only meaningful within a single process.
+    """
+
+    def __init__(self, backend, wal_path=None, flush_interval=1.0, max_batch=500,
+                 max_backoff=60.0, history=None, kiosk=None):
+        self.backend = backend
+        self.history = history
+        self.kiosk = safe_key(kiosk) if kiosk else default_kiosk()
+        self.wal_path = wal_path or f"attendance_wal.{self.kiosk}.jsonl"
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_backoff = max_backoff
+        self.pending = []
+        self.seq = 0
+        self.written = 0
+        self.failed_flushes = 0
+        self.cond = threading.Condition()
+        self.running = True
+        self.backoff = 0.0
+
+        self.wal = open(self.wal_path, 'a+')
+        self._lock_wal()
+        self.pending, self.seq = self._replay()
+        if self.pending:
+            print(f"Replaying {len(self.pending)} unsent attendance marks from {self.wal_path}")
+
+        self.thread = threading.Thread(target=self._run, name="attendance-sink", daemon=True)
+        self.thread.start()
+
+    def _lock_wal(self):
+        if fcntl is None:
+            return
+        try:
+            fcntl.flock(self.wal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.wal.close()
+            raise RuntimeError(f"Attendance log {self.wal_path} is in use by another process; "
+                               f"give each kiosk process on this host its own --kiosk name")
+
+    def _replay(self):
+        marks = {}
+        acked = 0
+        seq = 0
+        self.wal.seek(0)
+        for line in self.wal:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn write at the end of the log
+            if "ack" in record:
+                acked = max(acked, record["ack"])
+            else:
+                if "key" not in record:
+                    # Logged before marks had keys: derive a stable one so a retry still counts once
+                    ms = int(datetime.strptime(record["time"], "%Y-%m-%d %H:%M:%S").timestamp() * 1000)
+                    record.update(key=f"{ms:013d}-wal{record['seq']}", kiosk=self.kiosk)
+                marks[record["seq"]] = record
+                seq = max(seq, record["seq"])
+        if self.wal_path != LEGACY_WAL_PATH and os.path.exists(LEGACY_WAL_PATH) \
+                and os.path.getsize(LEGACY_WAL_PATH):
+            print(f"Warning: {LEGACY_WAL_PATH} from an older version is not replayed; "
+                  f"move it to {self.wal_path} while no kiosk is running to send its marks")
+        return [marks[s] for s in sorted(marks) if s > acked], seq
+
+    def _append(self, record):
+        self.wal.write(json.dumps(record) + "\n")
+        self.wal.flush()
+
+    def mark(self, student_id, timestamp, distance=None, camera=None):
+        """Queue one attendance mark; never blocks on the network"""
+        with self.cond:
+            self.seq += 1
+            record = {"seq": self.seq, "student_id": str(student_id), "time": timestamp, "key": event_key(),
+                      "distance": float(distance) if distance is not None else None, "camera": camera,
+                      "kiosk": self.kiosk}
+            self._append(record)
+            self.pending.append(record)
+            if len(self.pending) >= self.max_batch:
+                self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                if self.running:
+                    self.cond.wait(self.flush_interval + self.backoff)
+                batch = self.pending[:self.max_batch]
+                stopping = not self.running
+            if batch:
+                self._flush(batch)
+            if stopping:
+                with self.cond:
+                    if not self.pending or self.backoff:
+                        return
+
+    def _flush(self, batch):
+        try:
+            with METRICS.time("db_write"):
+                self.backend.write(batch)
+        except Exception as e:
+            self.failed_flushes += 1
+            self.backoff = min(self.max_backoff, max(1.0, self.backoff * 2))
+            print(f"Attendance flush failed ({len(batch)} marks kept for retry in {self.backoff:.0f}s): {e}")
+            return
+
+        with self.cond:
+            self.backoff = 0.0
+            del self.pending[:len(batch)]
+            self.written += len(batch)
+            METRICS.inc("marks_written", len(batch))
+            self._append({"ack": batch[-1]["seq"]})
+            if not self.pending:
+                # Everything is acknowledged, so the log can start over
+                self.wal.truncate(0)
+                self.wal.seek(0)
+
+        # Outside the lock: mark() must never wait on the local database either
+        if self.history is not None:
+            try:
+                self.history.record(batch)
+            except Exception as e:
+                print(f"Error recording attendance history locally: {e}")
+
+    def stats(self):
+        with self.cond:
+            return {"pending": len(self.pending), "written": self.written,
+                    "failed_flushes": self.failed_flushes}
+
+    def close(self, timeout=5.0):
+        """Flush what can be flushed; anything left stays in the log for next start"""
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            # A flush is still in flight and owns the log and history; whatever it
+            # does not acknowledge is replayed next start and counted once
+            print("Warning: attendance flush still running at shutdown; unsent marks stay in the log")
+            return
+        self.wal.close()
+        if self.history is not None:
+            self.history.close()
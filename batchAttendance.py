@@ -0,0 +1,226 @@
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import face_recognition
+from faceDetectors import HogDetector
+from faceTracker import FaceTracker
+from faceQuality import FaceQualityGate
+from encodingStore import DEFAULT_STORE_PATH
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Set per worker process by _init_worker, so the gallery is loaded once per process
+_matcher = None
+
+
+def list_images(folder):
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                  if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def plan_tasks(sources, segment_seconds=None, images_per_task=500):
+    """Split the inputs into (source, start, end) tasks
+
+    Videos become one task per file, or one per segment of segment_seconds.
+    Image folders become chunks of images_per_task files.
+    """
+    tasks = []
+    for source in sources:
+        if os.path.isdir(source):
+            count = len(list_images(source))
+            for start in range(0, count, images_per_task):
+                tasks.append((source, start, min(count, start + images_per_task)))
+            continue
+
+        cap = cv2.VideoCapture(source)
+        if not cap.isOpened():
+            print(f"Warning: skipping {source}: could not be opened")
+            continue
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        cap.release()
+        if not segment_seconds or frame_count <= 0:
+            tasks.append((source, 0, frame_count if frame_count > 0 else None))
+            continue
+        step = max(1, int(segment_seconds * fps))
+        for start in range(0, frame_count, step):
+            tasks.append((source, start, min(frame_count, start + step)))
+    return tasks
+
+
+def iter_frames(source, start, end, every):
+    """Yield (position, BGR frame) for every n-th frame of a task
+
+    Position is in seconds for videos and the image index for folders.
+    """
+    if os.path.isdir(source):
+        for index, path in enumerate(list_images(source)[start:end]):
+            if index % every == 0:
+                img = cv2.imread(path)
+                if img is not None:
+                    yield float(start + index), img
+        return
+
+    cap = cv2.VideoCapture(source)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    index = start
+    try:
+        while end is None or index < end:
+            # grab() skips decoding frames that are not going to be analysed
+            if (index - start) % every == 0:
+                success, img = cap.read()
+                if not success:
+                    break
+                yield index / fps, img
+            elif not cap.grab():
+                break
+            index += 1
+    finally:
+        cap.release()
+
+
+def _init_worker(store_path):
+    global _matcher
+    from recognitionEngine import load_matcher
+    # The gallery is memory-mapped, so worker processes share its pages
+    _matcher = load_matcher(store_path)
+
+
+def process_task(task, every=5, scale=0.5):
+    """Recognize faces in one task; runs in a worker process"""
+    source, start, end = task
+    detector = HogDetector()
+    tracker = FaceTracker(max_misses=2)
+    gate = FaceQualityGate()
+    sightings = {}
+    frames = 0
+    started = time.perf_counter()
+
+    for offset, img in iter_frames(source, start, end, every):
+        frames += 1
+        small = cv2.resize(img, (0, 0), None, scale, scale)
+        rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        locations = detector.detect(rgb)
+        tracks = tracker.update(locations)
+        pending = [i for i, track in enumerate(tracks) if tracker.needs_encoding(track)]
+        if pending:
+            accepted, _ = gate.filter(rgb, [locations[i] for i in pending], scale)
+            pending = [pending[i] for i in accepted]
+        if pending:
+            encodings = face_recognition.face_encodings(rgb, [locations[i] for i in pending])
+            for i, (student_id, distance) in zip(pending, _matcher.match(encodings)):
+                tracker.add_match(tracks[i], student_id, distance)
+        for track in tracks:
+            if track.identity is None:
+                continue
+            first, best, count = sightings.get(track.identity, (offset, track.distance, 0))
+            sightings[track.identity] = (min(first, offset), min(best, track.distance), count + 1)
+
+    elapsed = time.perf_counter() - started
+    return {"task": task, "pid": os.getpid(), "frames": frames, "seconds": elapsed,
+            "sightings": sightings, "rejected": dict(gate.rejections)}
+
+
+def merge_sightings(results, min_sightings=2):
+    """Deduplicate sightings across tasks: one event per student"""
+    merged = {}
+    for result in results:
+        source = result["task"][0]
+        for student_id, (first, best, count) in result["sightings"].items():
+            previous = merged.get(student_id)
+            if previous is None:
+                merged[student_id] = {"student_id": student_id, "source": source, "first_seen": first,
+                                      "distance": best, "sightings": count}
+            else:
+                previous["sightings"] += count
+                previous["distance"] = min(previous["distance"], best)
+                if first < previous["first_seen"]:
+                    previous["first_seen"], previous["source"] = first, source
+    return [event for event in merged.values() if event["sightings"] >= min_sightings]
+
+
+def run_batch(sources, store_path=DEFAULT_STORE_PATH, workers=None, every=5, scale=0.5,
+              segment_seconds=None, min_sightings=2):
+    tasks = plan_tasks(sources, segment_seconds)
+    print(f"{len(tasks)} tasks from {len(sources)} inputs")
+    started = time.perf_counter()
+    results = []
+    per_worker = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(store_path,)) as pool:
+        futures = [pool.submit(process_task, task, every, scale) for task in tasks]
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Error processing task: {e}")
+                continue
+            results.append(result)
+            frames, seconds = per_worker.get(result["pid"], (0, 0.0))
+            per_worker[result["pid"]] = (frames + result["frames"], seconds + result["seconds"])
+            source, start, end = result["task"]
+            rate = result["frames"] / result["seconds"] if result["seconds"] else 0.0
+            print(f"{source} [{start}:{end}] {result['frames']} frames in {result['seconds']:.1f}s "
+                  f"({rate:.1f} frames/sec), {len(result['sightings'])} students, "
+                  f"{sum(result['rejected'].values())} low-quality faces skipped")
+
+    wall = time.perf_counter() - started
+    total_frames = sum(frames for frames, _ in per_worker.values())
+    for pid, (frames, seconds) in sorted(per_worker.items()):
+        print(f"Worker {pid}: {frames} frames, {frames / seconds if seconds else 0.0:.1f} frames/sec")
+    print(f"Total: {total_frames} frames in {wall:.1f}s wall time "
+          f"({total_frames / wall if wall else 0.0:.1f} frames/sec)")
+    return merge_sightings(results, min_sightings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mark attendance from recorded videos or image folders")
+    parser.add_argument('sources', nargs='+', help="video files or folders of frames")
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH, help="gallery file")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--every', type=int, default=5, help="analyse every n-th frame")
+    parser.add_argument('--scale', type=float, default=0.5, help="downscale factor before detection")
+    parser.add_argument('--segment-seconds', type=float, default=None,
+                        help="split videos into segments of this length across workers")
+    parser.add_argument('--min-sightings', type=int, default=2)
+    parser.add_argument('--time', default=None, help="attendance time to record (default: now)")
+    parser.add_argument('--dry-run', action='store_true', help="print events without writing them")
+    args = parser.parse_args(argv)
+
+    events = run_batch(args.sources, args.store, args.workers, args.every, args.scale,
+                       args.segment_seconds, args.min_sightings)
+    for event in sorted(events, key=lambda e: e["student_id"]):
+        print(f"{event['student_id']}: seen {event['sightings']}x in {event['source']} "
+              f"at {event['first_seen']:.1f}, distance {event['distance']:.3f}")
+    if args.dry_run or not events:
+        return 0
+
+    from attendanceSink import FirebaseAttendanceBackend
+    from attendanceHistory import AttendanceHistory, event_key, default_kiosk
+    from recognitionEngine import init_firebase
+    timestamp = args.time or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    kiosk = default_kiosk()
+    log = [{"key": event_key(), "student_id": event["student_id"], "time": timestamp,
+            "distance": event["distance"], "camera": os.path.basename(event["source"]), "kiosk": kiosk}
+           for event in events]
+    try:
+        backend = FirebaseAttendanceBackend(init_firebase())
+        # Keyed events: running the same batch again after a failure does not count it twice,
+        # and last_attendance_time only moves forward
+        backend.write(log)
+        print(f"Marked attendance for {len(events)} students")
+        history = AttendanceHistory()
+        history.record(log)
+        history.close()
+    except Exception as e:
+        print(f"Error writing attendance: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import argparse
+import subprocess
+import numpy as np
+from encodingStore import DEFAULT_STORE_PATH
+
+# Reproducible benchmarks for the recognition hot path. Every stage reports
+# p50/p95/p99 latency and throughput; the whole run is emitted as JSON so
+# results can be compared across commits.
+
+
+def summarize(samples_ms, items=1):
+    """Latency percentiles and throughput for a list of per-call timings"""
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    if samples.size == 0:
+        return {"calls": 0}
+    total_s = samples.sum() / 1000
+    return {
+        "calls": int(samples.size),
+        "p50_ms": round(float(np.percentile(samples, 50)), 4),
+        "p95_ms": round(float(np.percentile(samples, 95)), 4),
+        "p99_ms": round(float(np.percentile(samples, 99)), 4),
+        "mean_ms": round(float(samples.mean()), 4),
+        "throughput_per_s": round(samples.size * items / total_s, 2) if total_s > 0 else None,
+    }
+
+
+def timed(fn, repeats, *args):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def timed_each(fn, items):
+    samples = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def log(message):
+    # Progress goes to stderr so stdout stays valid JSON
+    print(message, file=sys.stderr)
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process, or None where it is not available (Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def synthetic_gallery(size, dim=128, seed=0):
+    """Random unit-scale encodings resembling dlib's (norm around 1)"""
+    rng = np.random.default_rng(seed)
+    gallery = rng.normal(size=(size, dim)).astype(np.float32)
+    gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+    return gallery, [str(i) for i in range(size)]
+
+
+def bench_matching(sizes, faces_per_frame=3, repeats=200, approximate=False, seed=0):
+    from faceMatcher import FaceMatcher, IVFFaceMatcher
+
+    results = []
+    rng = np.random.default_rng(seed + 1)
+    for size in sizes:
+        gallery, ids = synthetic_gallery(size, seed=seed)
+        queries = gallery[rng.choice(size, faces_per_frame)] + \
+            rng.normal(size=(faces_per_frame, 128)).astype(np.float32) * 0.02
+        matchers = [("exact", FaceMatcher)]
+        if approximate:
+            matchers.append(("ivf", IVFFaceMatcher))
+        for name, cls in matchers:
+            start = time.perf_counter()
+            matcher = cls(gallery, ids)
+            build_ms = (time.perf_counter() - start) * 1000
+            matcher.match(queries)  # warm up
+            row = summarize(timed(matcher.match, repeats, queries), items=faces_per_frame)
+            row.update({"gallery_size": size, "matcher": name, "build_ms": round(build_ms, 2)})
+            results.append(row)
+            log(f"match {name:>5} gallery={size:>8}: p50 {row['p50_ms']} ms, p99 {row['p99_ms']} ms")
+        del gallery
+    return results
+
+
+def generate_frames(images_dir='Images', count=30, size=500, seed=0):
+    """Build kiosk-like frames by placing enrollment photos on a plain background"""
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    faces = [cv2.imread(os.path.join(images_dir, name)) for name in sorted(os.listdir(images_dir))]
+    faces = [face for face in faces if face is not None]
+    frames = []
+    for i in range(count):
+        frame = np.full((size, size, 3), 90 + (i % 5) * 20, dtype=np.uint8)
+        if faces and i % 6 != 0:  # every sixth frame is empty, like an idle kiosk
+            face = faces[i % len(faces)]
+            side = int(rng.integers(size // 3, size // 2))
+            face = cv2.resize(face, (side, int(side * face.shape[0] / face.shape[1])))
+            h, w = min(face.shape[0], size), min(face.shape[1], size)
+            y, x = int(rng.integers(0, size - h + 1)), int(rng.integers(0, size - w + 1))
+            frame[y:y + h, x:x + w] = face[:h, :w]
+        frames.append(frame)
+    return frames
+
+
+def load_frames(path, limit=100):
+    """Read recorded frames from a video file or a folder of images"""
+    import cv2
+
+    frames = []
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path))[:limit]:
+            img = cv2.imread(os.path.join(path, name))
+            if img is not None:
+                frames.append(cv2.resize(img, (500, 500)))
+        return frames
+    cap = cv2.VideoCapture(path)
+    while len(frames) < limit:
+        success, img = cap.read()
+        if not success:
+            break
+        frames.append(cv2.resize(img, (500, 500)))
+    cap.release()
+    return frames
+
+
+def bench_vision(frames, scale=0.25):
+    """Detection and encoding latency on recorded or generated frames"""
+    import cv2
+    import face_recognition
+
+    resize, detect, encode = [], [], []
+    faces = 0
+    for frame in frames:
+        start = time.perf_counter()
+        small = cv2.cvtColor(cv2.resize(frame, (0, 0), None, scale, scale), cv2.COLOR_BGR2RGB)
+        resize.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        locations = face_recognition.face_locations(small)
+        detect.append((time.perf_counter() - start) * 1000)
+
+        if locations:
+            start = time.perf_counter()
+            face_recognition.face_encodings(small, locations)
+            encode.append((time.perf_counter() - start) * 1000)
+            faces += len(locations)
+    result = {"frames": len(frames), "faces": faces, "resize": summarize(resize),
+              "face_locations": summarize(detect), "face_encodings": summarize(encode)}
+    log(f"vision: detect p50 {result['face_locations'].get('p50_ms')} ms, "
+        f"encode p50 {result['face_encodings'].get('p50_ms')} ms")
+    return result
+
+
+def bench_engine(frames, store_path):
+    """End-to-end RecognitionEngine latency against a fake Firebase backend"""
+    from fakeFirebase import FakeDb
+    from attendanceSink import AttendanceSink, FirebaseAttendanceBackend
+    from studentCache import StudentCache
+    from recognitionEngine import RecognitionEngine, load_matcher
+
+    matcher = load_matcher(store_path)
+    db = FakeDb({"Students": {sid: {"name": f"Student {sid}", "total_attendance": 0}
+                              for sid in matcher.ids}})
+    with tempfile.TemporaryDirectory() as tmp:
+        sink = AttendanceSink(FirebaseAttendanceBackend(db), os.path.join(tmp, 'wal.jsonl'))
+        cache = StudentCache(db)
+        cache.prefetch()
+        engine = RecognitionEngine(matcher, cache, sink)
+        per_frame = timed_each(engine.process_frame, frames)
+        engine.close()
+    result = summarize(per_frame)
+    result["stats"] = {"events": engine.events}
+    log(f"engine: p50 {result.get('p50_ms')} ms/frame")
+    return result
+
+
+def bench_io(students=10000, marks=2000, seed=0):
+    """Student cache and attendance sink overhead against the in-memory fake database"""
+    from fakeFirebase import FakeDb
+    from attendanceSink import AttendanceSink, FirebaseAttendanceBackend
+    from studentCache import StudentCache
+
+    rng = np.random.default_rng(seed)
+    db = FakeDb({"Students": {str(i): {"name": f"Student {i}", "total_attendance": 0,
+                                       "last_attendance_time": "2024-01-01 00:00:00"}
+                              for i in range(students)}})
+    cache = StudentCache(db)
+    start = time.perf_counter()
+    cache.prefetch()
+    prefetch_ms = (time.perf_counter() - start) * 1000
+    ids = [str(i) for i in rng.integers(0, students, marks)]
+    cache_get = timed_each(cache.get, ids)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sink = AttendanceSink(FirebaseAttendanceBackend(db), os.path.join(tmp, 'wal.jsonl'),
+                              flush_interval=0.05)
+        mark = timed_each(lambda sid: sink.mark(sid, "2024-01-01 08:00:00"), ids)
+        start = time.perf_counter()
+        sink.close()
+        drain_ms = (time.perf_counter() - start) * 1000
+
+    result = {"students": students, "prefetch_ms": round(prefetch_ms, 2), "cache_get": summarize(cache_get),
+              "sink_mark": summarize(mark), "sink_drain_ms": round(drain_ms, 2),
+              "db_calls": dict(db.calls)}
+    log(f"io: cache get p50 {result['cache_get']['p50_ms']} ms, mark p50 {result['sink_mark']['p50_ms']} ms")
+    return result
+
+
+def git_commit():
+    try:
+        # The repository the benchmark belongs to, wherever it is run from
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the recognition hot path")
+    parser.add_argument('--stages', nargs='+', default=['matching', 'io'],
+                        choices=['matching', 'vision', 'engine', 'io'])
+    parser.add_argument('--gallery-sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--faces-per-frame', type=int, default=3)
+    parser.add_argument('--repeats', type=int, default=200)
+    parser.add_argument('--approximate', action='store_true', help="also benchmark the IVF matcher")
+    parser.add_argument('--frames', default=None, help="video file or image folder of recorded frames "
+                                                        "(default: frames generated from Images/)")
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH, help="gallery for the engine stage")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = {"commit": git_commit(), "python": platform.python_version(), "machine": platform.machine(),
+              "cpus": os.cpu_count(), "seed": args.seed, "results": {}}
+    started = time.perf_counter()
+
+    if 'matching' in args.stages:
+        report["results"]["matching"] = bench_matching(args.gallery_sizes, args.faces_per_frame,
+                                                       args.repeats, args.approximate, args.seed)
+    if 'vision' in args.stages or 'engine' in args.stages:
+        frames = load_frames(args.frames) if args.frames else generate_frames(seed=args.seed)
+        if 'vision' in args.stages:
+            report["results"]["vision"] = bench_vision(frames)
+        if 'engine' in args.stages:
+            report["results"]["engine"] = bench_engine(frames, args.store)
+    if 'io' in args.stages:
+        report["results"]["io"] = bench_io(seed=args.seed)
+
+    report["wall_s"] = round(time.perf_counter() - started, 2)
+    report["peak_rss_mb"] = peak_rss_mb()
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+        log(f"Results written to {args.output}")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,356 @@
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+import cv2
+from framePipeline import PipelineStage, StageStats
+from metrics import METRICS, start_metrics_server, install_profile_signal
+from encodingStore import DEFAULT_STORE_PATH
+from faceMatcher import AGGREGATIONS, INDEXES
+from galleryWatcher import GalleryWatcher, install_reload_signal, store_signature
+
+
+def parse_source(spec, default_name=None):
+    """Parse "name=source" or "source" into (name, source)
+
+    Digits become a device index; anything else (RTSP/HTTP URL, video file)
+    is passed to cv2.VideoCapture as is.
+    """
+    name, sep, source = spec.partition('=')
+    if not sep or '://' in name:
+        name, source = default_name, spec
+    if source.isdigit():
+        source = int(source)
+    if name is None:
+        name = f"cam{source}" if isinstance(source, int) else os.path.splitext(os.path.basename(source))[0]
+    return name, source
+
+
+class CameraSource:
+    """One configured camera with its own capture thread
+
+    Live sources are reopened with a growing delay when they stop
+    delivering frames. Video files stand in for live cameras: they are
+    played at their native frame rate and loop at the end.
+    """
+
+    def __init__(self, name, source, scheduler, width=640, height=480, max_reconnect_delay=30.0):
+        self.name = name
+        self.source = source
+        self.scheduler = scheduler
+        self.width = width
+        self.height = height
+        self.max_reconnect_delay = max_reconnect_delay
+        self.is_file = isinstance(source, str) and os.path.isfile(source)
+        self.cap = None
+        self.frame_interval = 0.0
+        self.next_frame_at = 0.0
+        self.reconnect_delay = 0.0
+        self.next_attempt_at = 0.0
+        self.reconnects = 0
+        self.engine = None
+        self.inference_stats = StageStats(f"{name}/inference")
+        self.capture_stage = PipelineStage(f"{name}/capture", self.read_frame, output_queues=[self])
+
+    def open(self):
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            cap.release()
+            return False
+        if self.is_file:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            self.frame_interval = 1.0 / fps if fps and fps > 0 else 1.0 / 25
+        else:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        self.cap = cap
+        self.reconnect_delay = 0.0
+        print(f"Camera {self.name} opened ({self.source})")
+        return True
+
+    def read_frame(self):
+        """Capture stage: one frame, or None while the source is unavailable"""
+        if self.cap is None:
+            if time.monotonic() < self.next_attempt_at or not self.open():
+                self._schedule_reconnect()
+                return None
+
+        if self.is_file:
+            # Pace recorded video like a live camera
+            delay = self.next_frame_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_frame_at = max(self.next_frame_at + self.frame_interval, time.monotonic())
+
+        with METRICS.time(f"capture:{self.name}"):
+            success, img = self.cap.read()
+        if success:
+            return img
+        if self.is_file:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            return None
+
+        print(f"Warning: camera {self.name} stopped delivering frames, reconnecting")
+        self.cap.release()
+        self.cap = None
+        self.reconnects += 1
+        self._schedule_reconnect()
+        return None
+
+    def _schedule_reconnect(self):
+        if time.monotonic() >= self.next_attempt_at:
+            self.reconnect_delay = min(self.max_reconnect_delay, max(1.0, self.reconnect_delay * 2))
+            self.next_attempt_at = time.monotonic() + self.reconnect_delay
+        time.sleep(0.1)
+
+    def put(self, frame):
+        self.scheduler.put(self.name, frame)
+
+    def stats(self):
+        capture = self.capture_stage.stats.snapshot()
+        inference = self.inference_stats.snapshot()
+        return {"camera": self.name, "capture_fps": capture["fps"], "inference_fps": inference["fps"],
+                "inference_ms": inference["avg_ms"], "dropped": self.scheduler.dropped.get(self.name, 0),
+                "reconnects": self.reconnects, "online": self.cap is not None}
+
+    def close(self):
+        self.capture_stage.stop()
+        self.capture_stage.join(timeout=1.0)
+        if self.cap is not None:
+            self.cap.release()
+
+
+class FairScheduler:
+    """Hands the newest frame of each camera to inference workers, round-robin
+
+    Each camera keeps a single slot holding its latest frame, so a busy pool
+    drops stale frames instead of queueing them. Workers take cameras in
+    rotation, so a fast or crowded camera cannot starve the others, and a
+    camera is never processed by two workers at once, which keeps its
+    tracker single-threaded and its frames in order.
+    """
+
+    def __init__(self, names):
+        self.order = list(names)
+        self.latest = {}
+        self.busy = set()
+        self.dropped = {}
+        self.next_index = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def put(self, name, frame):
+        with self.cond:
+            if name in self.latest:
+                self.dropped[name] = self.dropped.get(name, 0) + 1
+            self.latest[name] = frame
+            self.cond.notify()
+
+    def _pick(self):
+        for offset in range(len(self.order)):
+            index = (self.next_index + offset) % len(self.order)
+            name = self.order[index]
+            if name in self.latest and name not in self.busy:
+                self.next_index = index + 1
+                return name
+        return None
+
+    def acquire(self, timeout=0.5):
+        """Wait for a camera with a waiting frame; returns (name, frame) or None"""
+        with self.cond:
+            name = self._pick()
+            if name is None and not self.closed:
+                self.cond.wait(timeout)
+                name = self._pick()
+            if name is None:
+                return None
+            self.busy.add(name)
+            return name, self.latest.pop(name)
+
+    def release(self, name):
+        with self.cond:
+            self.busy.discard(name)
+            self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class CameraManager:
+    """Runs several cameras against one gallery, student cache and attendance sink
+
+    Every camera has its own capture thread and its own engine state
+    (detector level, tracks, cooldowns); a shared pool of inference threads
+    serves all of them through a FairScheduler.
+    """
+
+    def __init__(self, engine, sources, workers=None, on_result=None):
+        names = [name for name, _ in sources]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Camera names must be unique: {names}")
+        self.engine = engine
+        self.scheduler = FairScheduler(names)
+        self.cameras = {}
+        for i, (name, source) in enumerate(sources):
+            camera = CameraSource(name, source, self.scheduler)
+            camera.engine = engine if i == 0 else engine.camera_engine()
+            camera.engine.camera = name
+            self.cameras[name] = camera
+        self.workers = workers or min(len(sources), os.cpu_count() or 1)
+        self.on_result = on_result
+        self.running = False
+        self.threads = []
+
+    def start(self):
+        self.running = True
+        for camera in self.cameras.values():
+            camera.capture_stage.start()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"inference-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _work(self):
+        while self.running:
+            item = self.scheduler.acquire()
+            if item is None:
+                continue
+            name, frame = item
+            camera = self.cameras[name]
+            start = time.perf_counter()
+            try:
+                result = camera.engine.process_frame(frame)
+                if self.on_result is not None:
+                    self.on_result(camera, result)
+            except Exception as e:
+                print(f"Error in inference for camera {name}: {e}")
+                continue
+            finally:
+                self.scheduler.release(name)
+            elapsed = time.perf_counter() - start
+            camera.inference_stats.record(elapsed)
+            METRICS.observe(f"inference:{name}", elapsed)
+
+    def stats(self):
+        return [camera.stats() for camera in self.cameras.values()]
+
+    def close(self):
+        self.running = False
+        self.scheduler.close()
+        for camera in self.cameras.values():
+            camera.close()
+        for thread in self.threads:
+            thread.join(timeout=2.0)
+        # The engines share the cache and sink, so closing the first closes them for all
+        self.engine.close()
+
+
+def format_camera_stats(stats):
+    return ", ".join(f"{s['camera']}: {s['capture_fps']} fps in, {s['inference_fps']} fps recognized "
+                     f"({s['inference_ms']} ms, {s['dropped']} dropped"
+                     f"{'' if s['online'] else ', offline'})" for s in stats)
+
+
+def print_events(camera, result):
+    for event in result["events"]:
+        name = event["student_info"].get('name', 'Unknown')
+        print(f"{event['time']} [{camera.name}] {event['student_id']} {name}: {event['state']}")
+
+
+
+def main(argv=None):
+    from recognitionEngine import init_firebase, create_engine
+
+    parser = argparse.ArgumentParser(description="Run face recognition attendance on several cameras at once")
+    parser.add_argument('sources', nargs='+',
+                        help="cameras as [name=]source: a device index, an RTSP/HTTP URL or a video file")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="inference threads shared by all cameras (default: one per camera, up to the CPU count)")
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH, help="gallery file")
+    parser.add_argument('--target-ms', type=float, default=60.0, help="detection latency budget per camera")
+    parser.add_argument('--aggregation', choices=AGGREGATIONS, default="min",
+                        help="how several templates of one student are scored")
+    parser.add_argument('--index', choices=INDEXES, default="exact",
+                        help="gallery index: exact, or approximate ivf for very large galleries (min aggregation)")
+    parser.add_argument('--nprobe', type=int, default=8, help="clusters scanned per query with --index ivf")
+    parser.add_argument('--live-templates', action='store_true',
+                        help="add confident live captures as extra templates")
+    parser.add_argument('--no-motion-gate', action='store_true',
+                        help="run detection on every frame, even when the scene is static")
+    parser.add_argument('--match-server', default=None,
+                        help="match on a shared matchServer.py at this address instead of loading the gallery")
+    parser.add_argument('--reload-interval', type=float, default=2.0,
+                        help="seconds between checks of the gallery for changes (0: only on SIGHUP)")
+    parser.add_argument('--kiosk', default=None,
+                        help="kiosk name for the attendance log (default: host name); "
+                             "each kiosk process on a host needs its own")
+    parser.add_argument('--wal', default=None,
+                        help="local attendance write-ahead log (default: attendance_wal.<kiosk>.jsonl)")
+    parser.add_argument('--stats-interval', type=float, default=30.0)
+    parser.add_argument('--metrics-port', type=int, default=9108, help="local metrics endpoint (0 to disable)")
+    args = parser.parse_args(argv)
+
+    try:
+        sources = [parse_source(spec) for spec in args.sources]
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    install_profile_signal()
+
+    # Taken before loading, so an enrollment that lands during the load is applied on the first poll
+    signature = store_signature(args.store)
+    try:
+        db = init_firebase()
+        print("Firebase initialized successfully")
+        engine = create_engine(db, args.store, args.target_ms, args.aggregation, args.live_templates,
+                               not args.no_motion_gate, args.match_server, kiosk=args.kiosk, wal_path=args.wal,
+                               index=args.index, nprobe=args.nprobe)
+    except Exception as e:
+        print(f"Error starting recognition engine: {e}")
+        return 1
+    try:
+        manager = CameraManager(engine, sources, args.workers, on_result=print_events)
+    except Exception as e:
+        print(f"Error starting cameras: {e}")
+        # Stops the student cache listener, which would otherwise keep the process alive
+        engine.close()
+        return 1
+
+    running = [True]
+
+    def stop(signum, frame):
+        running[0] = False
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    watcher = None
+    try:
+        if not args.match_server:
+            watcher = GalleryWatcher(args.store, [camera.engine for camera in manager.cameras.values()],
+                                     args.reload_interval, loaded=signature).start()
+            install_reload_signal(watcher)
+        manager.start()
+        print(f"Recognition running on {len(sources)} cameras with {manager.workers} inference threads, "
+              "Ctrl+C to stop")
+        last_log = time.time()
+        while running[0]:
+            time.sleep(0.2)
+            if time.time() - last_log >= args.stats_interval:
+                last_log = time.time()
+                print(f"Cameras: {format_camera_stats(manager.stats())}")
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        manager.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
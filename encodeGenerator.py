@@ -1,56 +1,263 @@
 import cv2
 import face_recognition
-import pickle
 import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import firebase_admin
 from firebase_admin import credentials
 from firebase_admin import db
 from firebase_admin import  storage
+from collections import Counter
+from faceQuality import FaceQualityGate
+from imageUploader import upload_folder, list_image_paths
+from encodingStore import (GalleryWriter, next_delta_path, clear_deltas, base_generation, DEFAULT_STORE_PATH,
+                           MODEL_VERSION)
 
-cred = credentials.Certificate("serviceAccountKey.json")
-firebase_admin.initialize_app(cred, {
-    'databaseURL': "https://facetendance-default-rtdb.firebaseio.com/",
-    'storageBucket': "facetendance.appspot.com"
-})
+folderPath = 'Images'
+cacheFile = 'EncodeCache.json'
+QUALITY_PREFIX = "rejected by quality gate: "
 
+# Anything that changes the encoding of an unchanged image must be part of this,
+# so that changing it invalidates the cache
+ENCODING_PARAMS = {"model_version": MODEL_VERSION, "num_jitters": 1, "model": "small"}
 
-# Importing student images
-folderPath = 'Images'
-pathList = os.listdir(folderPath)
-print(pathList)
-imgList = []
-studentIds = []
-for path in pathList:
-    imgList.append(cv2.imread(os.path.join(folderPath, path)))
-    studentIds.append(os.path.splitext(path)[0])
+# Enrolled photos are full-size, so the size check uses scale 1.0; rejected
+# photos never make it into the gallery as poor templates
+ENROLL_QUALITY = FaceQualityGate()
+ENCODING_PARAMS["quality"] = ENROLL_QUALITY.params()
+
+
+def init_firebase():
+    cred = credentials.Certificate("serviceAccountKey.json")
+    firebase_admin.initialize_app(cred, {
+        'databaseURL': "https://facetendance-default-rtdb.firebaseio.com/",
+        'storageBucket': "facetendance.appspot.com"
+    })
+
+
+def params_key(params=ENCODING_PARAMS):
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def hash_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-    fileName = f'{folderPath}/{path}'
-    bucket = storage.bucket()
-    blob = bucket.blob(fileName)
-    blob.upload_from_filename(fileName)
 
+def load_cache(path=cacheFile):
+    """Per-image cache: file name -> hash, params, student id and encoding"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable encoding cache {path}: {e}")
+        return {}
 
-    # print(path)
-    # print(os.path.splitext(path)[0])
-print(studentIds)
 
+def save_cache(cache, path=cacheFile):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, path)
 
-def findEncodings(imagesList):
-    encodeList = []
-    for img in imagesList:
+
+def student_id_for(path):
+    """Student id for an image: Images/57.png, Images/57_2.png and Images/57/front.png all belong to 57"""
+    parts = path.replace(os.sep, '/').split('/')
+    if len(parts) > 1:
+        return parts[0]
+    stem = os.path.splitext(parts[0])[0]
+    base, sep, suffix = stem.rpartition('_')
+    if sep and base and suffix.isdigit():
+        return base
+    return stem
+
+
+def encode_image(folder, path):
+    """Decode and encode one image; runs in a worker process
+
+    Returns (path, encoding or None, error message or None) instead of
+    raising, so one bad image cannot stop the whole run.
+    """
+    try:
+        img = cv2.imread(os.path.join(folder, path))
+        if img is None:
+            return path, None, "could not be decoded"
         img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        encode = face_recognition.face_encodings(img)[0]
-        encodeList.append(encode)
+        boxes = face_recognition.face_locations(img)
+        if not boxes:
+            return path, None, "no face found"
+        # Enroll the largest face, and only if it passes the quality gate
+        box = max(boxes, key=lambda b: (b[2] - b[0]) * (b[1] - b[3]))
+        reason = ENROLL_QUALITY.assess(img, box, scale=1.0)
+        if reason is not None:
+            return path, None, f"{QUALITY_PREFIX}{reason}"
+        encodings = face_recognition.face_encodings(img, [box], num_jitters=ENCODING_PARAMS["num_jitters"],
+                                                    model=ENCODING_PARAMS["model"])
+        return path, [float(v) for v in encodings[0]], None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def findEncodings(pathList, folder=folderPath, workers=None):
+    """Yield (path, encoding, error) for each image as soon as it is encoded
+
+    Images are decoded lazily inside the workers and at most two tasks per
+    worker are in flight, so memory stays bounded however many images there are.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        for path in pathList:
+            yield encode_image(folder, path)
+        return
+
+    paths = iter(pathList)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(encode_image, folder, path) for _, path in zip(range(workers * 2), paths)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+                nextPath = next(paths, None)
+                if nextPath is not None:
+                    pending.add(pool.submit(encode_image, folder, nextPath))
+
+
+def scan_images(folder, cache):
+    """Split the image folder into changed and deleted files relative to the cache"""
+    key = params_key()
+    pathList = list_image_paths(folder)
+    changed = {}
+    for path in pathList:
+        digest = hash_file(os.path.join(folder, path))
+        entry = cache.get(path)
+        if entry is None or entry["hash"] != digest or entry["params"] != key:
+            changed[path] = digest
+    deleted = [path for path in cache if path not in pathList]
+    return pathList, changed, deleted
+
+
+def upload_images(folder, pathList, workers=8):
+    # Concurrent, deduplicated by MD5 against the bucket, and resumable
+    upload_folder(storage.bucket(), folder, pathList, workers=workers)
+
+
+def enroll(folder=folderPath, store_path=DEFAULT_STORE_PATH, cache_path=cacheFile, full=False, workers=None):
+    """Encode new and changed images into the gallery; returns 1 if a student with photos has no template"""
+    cache = load_cache(cache_path)
+    pathList, changed, deleted = scan_images(folder, cache)
+    print(f"{len(pathList)} images, {len(changed)} new or changed, {len(deleted)} deleted")
+
+    affectedIds = {cache[path]["student_id"] for path in deleted}
+    affectedIds.update(cache[path]["student_id"] for path in changed if path in cache)
+    affectedIds.update(student_id_for(path) for path in changed)
+    # Kept in case all of a student's new photos are rejected
+    previous = {}
+    for path in list(deleted) + list(changed):
+        entry = cache.pop(path, None)
+        if entry is not None:
+            previous[path] = entry
+
+    rebuild = full or not os.path.exists(store_path)
+    if not rebuild and not affectedIds:
+        print("Gallery is up to date")
+        save_cache(cache, cache_path)
+        upload_images(folder, pathList)
+        return 0
+
+    # A full rebuild rewrites every row under a new generation, so readers ignore the
+    # old deltas from the moment it is published; a delta replaces every row of an
+    # affected student
+    if rebuild:
+        writer = GalleryWriter(store_path)
+    else:
+        writer = GalleryWriter(next_delta_path(store_path), delta=True, generation=base_generation(store_path))
+        for studentId in sorted(affectedIds):
+            writer.remove(studentId)
+
+    with writer:
+        for path, entry in sorted(cache.items()):
+            if entry["encoding"] is not None and (rebuild or entry["student_id"] in affectedIds):
+                writer.add(entry["student_id"], entry["encoding"])
+
+        print("Encoding Started ...")
+        key = params_key()
+        start = time.perf_counter()
+        encoded = skipped = 0
+        rejected = Counter()
+        for path, encode, error in findEncodings(list(changed), folder, workers):
+            if error:
+                print(f"Warning: skipping {path}: {error}")
+                skipped += 1
+                if error.startswith(QUALITY_PREFIX):
+                    rejected[error[len(QUALITY_PREFIX):]] += 1
+            else:
+                writer.add(student_id_for(path), encode)
+                encoded += 1
+            # Failed images are cached too, so they are only retried once the file changes
+            cache[path] = {"hash": changed[path], "params": key, "student_id": student_id_for(path),
+                           "encoding": encode}
+        elapsed = time.perf_counter() - start
+        rate = (encoded + skipped) / elapsed if elapsed > 0 else 0.0
+        print(f"Encoding Complete: {encoded} encoded, {skipped} skipped in {elapsed:.1f}s ({rate:.1f} images/sec)")
+        if rejected:
+            print("Rejected by quality gate: " + ", ".join(f"{n} {reason}" for reason, n in rejected.most_common()))
+
+        # A student who still has photos but no usable one keeps the previous
+        # templates rather than dropping out of the gallery. Their old cache
+        # entries are restored, so the new photos are retried on the next run.
+        templates = Counter(entry["student_id"] for entry in cache.values() if entry["encoding"] is not None)
+        enrolled = {student_id_for(path) for path in pathList}
+        missing = sorted(studentId for studentId in enrolled
+                         if not templates[studentId] and (rebuild or studentId in affectedIds))
+        kept = []
+        for studentId in missing:
+            old = {path: entry for path, entry in previous.items()
+                   if entry["student_id"] == studentId and entry["encoding"] is not None}
+            for path, entry in sorted(old.items()):
+                writer.add(studentId, entry["encoding"])
+                cache[path] = entry
+            if old:
+                kept.append(studentId)
+
+    if rebuild:
+        clear_deltas(store_path)
+        print(f"Gallery written with {len(writer.ids)} encodings")
+    else:
+        print(f"Delta written to {writer.path} for {len(affectedIds)} students")
+
+    save_cache(cache, cache_path)
+    print("File Saved")
+    # Only images that are new, changed, or failed to upload last time are sent
+    upload_images(folder, pathList)
+    if missing:
+        print(f"Error: {len(missing)} students have no usable photo: {', '.join(missing)}"
+              + (f" (previous templates kept for {', '.join(kept)})" if kept else ""))
+        return 1
+    return 0
+
 
-    return encodeList
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Encode student images into the gallery")
+    parser.add_argument('--images', default=folderPath)
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH)
+    parser.add_argument('--cache', default=cacheFile)
+    parser.add_argument('--full', action='store_true', help="rewrite the whole gallery instead of a delta")
+    parser.add_argument('--workers', type=int, default=None, help="encoding processes (default: CPU count)")
+    args = parser.parse_args(argv)
 
+    init_firebase()
+    return enroll(args.images, args.store, args.cache, args.full, args.workers)
 
-print("Encoding Started ...")
-encodeListKnown = findEncodings(imgList)
-encodeListKnownWithIds = [encodeListKnown, studentIds]
-print("Encoding Complete")
 
-file = open("EncodeFile.p", 'wb')
-pickle.dump(encodeListKnownWithIds, file)
-file.close()
-print("File Saved")
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
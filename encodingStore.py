@@ -0,0 +1,317 @@
+import os
+import sys
+import json
+import zlib
+import struct
+import pickle
+import argparse
+import numpy as np
+
+# On-disk gallery layout (all little-endian):
+#   64-byte header | float32 matrix [count x dim] | UTF-8 JSON id table
+# The matrix starts at a fixed offset so it can be opened directly with numpy.memmap.
+# The last header field is the base generation: a base gallery gets a new one
+# whenever it is rebuilt, and a delta records the generation it was written
+# against. Files from before the field existed read as generation 0.
+MAGIC = b'FTGALLRY'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sHHIQQQ16sII')
+HEADER_SIZE = HEADER.size
+ENCODING_DIM = 128
+MODEL_VERSION = 'dlib_resnet_v1'
+DEFAULT_STORE_PATH = 'EncodeFile.gal'
+
+FLAG_DELTA = 1
+
+
+class GalleryFormatError(Exception):
+    """Raised when a gallery file is missing, truncated or corrupt"""
+
+
+class Gallery:
+    """A loaded gallery: memory-mapped encodings plus their student ids"""
+
+    def __init__(self, path, encodings, ids, model_version, removed=None, is_delta=False, generation=0):
+        self.path = path
+        self.encodings = encodings
+        self.ids = ids
+        self.model_version = model_version
+        self.removed = removed or []
+        self.is_delta = is_delta
+        self.generation = generation
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class GalleryWriter:
+    """Stream encodings into a new gallery file
+
+    Rows are written as they are added, so callers never hold the whole
+    gallery in memory. The file is written under a temporary name and moved
+    into place on close, so readers never see a half-written gallery.
+    A base gallery gets a new generation unless one is given; a delta
+    should be given the generation of its base (see base_generation).
+    """
+
+    def __init__(self, path, dim=ENCODING_DIM, model_version=MODEL_VERSION, delta=False, generation=None):
+        self.path = path
+        self.dim = dim
+        self.model_version = model_version
+        self.delta = delta
+        if generation is None:
+            generation = 0 if delta else int.from_bytes(os.urandom(4), 'little') or 1
+        self.generation = generation
+        self.ids = []
+        self.removed = []
+        self.crc = 0
+        self.tmp_path = f"{path}.tmp"
+        self.file = open(self.tmp_path, 'wb')
+        self.file.write(b'\0' * HEADER_SIZE)
+
+    def add(self, student_id, encoding):
+        row = np.asarray(encoding, dtype='<f4').reshape(-1)
+        if row.shape[0] != self.dim:
+            raise ValueError(f"Expected a {self.dim}-d encoding for {student_id}, got {row.shape[0]}")
+        data = row.tobytes()
+        self.crc = zlib.crc32(data, self.crc)
+        self.file.write(data)
+        self.ids.append(str(student_id))
+
+    def remove(self, student_id):
+        """Record a removal; only meaningful for delta files"""
+        self.removed.append(str(student_id))
+
+    def close(self):
+        ids_offset = HEADER_SIZE + len(self.ids) * self.dim * 4
+        table = json.dumps({"ids": self.ids, "removed": self.removed}).encode('utf-8')
+        self.crc = zlib.crc32(table, self.crc)
+        self.file.write(table)
+
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, FLAG_DELTA if self.delta else 0, self.dim,
+                                    len(self.ids), ids_offset, len(table),
+                                    self.model_version.encode('ascii')[:16], self.crc, self.generation))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_gallery(path, encodings, ids, model_version=MODEL_VERSION, generation=None):
+    """Write a complete gallery in one call"""
+    with GalleryWriter(path, model_version=model_version, generation=generation) as writer:
+        for student_id, encoding in zip(ids, encodings):
+            writer.add(student_id, encoding)
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE:
+        raise GalleryFormatError(f"Gallery file is truncated: {path}")
+    (magic, version, flags, dim, count, ids_offset, ids_length,
+     model_version, crc, generation) = HEADER.unpack(raw)
+    if magic != MAGIC:
+        raise GalleryFormatError(f"Not a gallery file: {path}")
+    if version != FORMAT_VERSION:
+        raise GalleryFormatError(f"Unsupported gallery format version {version} in {path}")
+    return {
+        "flags": flags,
+        "dim": dim,
+        "count": count,
+        "ids_offset": ids_offset,
+        "ids_length": ids_length,
+        "model_version": model_version.rstrip(b'\0').decode('ascii'),
+        "crc": crc,
+        "generation": generation,
+    }
+
+
+def open_gallery(path, verify=False, model_version=None):
+    """Open a gallery file with its encodings memory-mapped read-only
+
+    Processes that open the same file share its pages, so several kiosks on
+    one host pay for the gallery only once. Pass verify=True to check the
+    checksum, which reads the whole file.
+    """
+    if not os.path.exists(path):
+        raise GalleryFormatError(f"Gallery file not found: {path}")
+    header = read_header(path)
+    if model_version is not None and header["model_version"] != model_version:
+        raise GalleryFormatError(f"Gallery {path} was built with model {header['model_version']}, "
+                                 f"expected {model_version}")
+
+    expected_size = header["ids_offset"] + header["ids_length"]
+    if os.path.getsize(path) < expected_size:
+        raise GalleryFormatError(f"Gallery file is truncated: {path}")
+
+    with open(path, 'rb') as f:
+        f.seek(header["ids_offset"])
+        table = f.read(header["ids_length"])
+
+    count, dim = header["count"], header["dim"]
+    if count:
+        encodings = np.memmap(path, dtype='<f4', mode='r', offset=HEADER_SIZE, shape=(count, dim))
+    else:
+        encodings = np.empty((0, dim), dtype=np.float32)
+
+    if verify:
+        crc = zlib.crc32(np.ascontiguousarray(encodings).tobytes())
+        if zlib.crc32(table, crc) != header["crc"]:
+            raise GalleryFormatError(f"Checksum mismatch in gallery file: {path}")
+
+    id_table = json.loads(table.decode('utf-8'))
+    if len(id_table["ids"]) != count:
+        raise GalleryFormatError(f"Id table does not match encoding count in {path}")
+    return Gallery(path, encodings, id_table["ids"], header["model_version"],
+                   id_table.get("removed", []), bool(header["flags"] & FLAG_DELTA), header["generation"])
+
+
+def delta_paths(path):
+    """Delta files recorded against a base gallery, in the order they were written"""
+    directory = os.path.dirname(path) or '.'
+    prefix = os.path.basename(path) + '.d'
+    names = [name for name in os.listdir(directory)
+             if name.startswith(prefix) and name[len(prefix):].isdigit()]
+    names.sort(key=lambda name: int(name[len(prefix):]))
+    return [os.path.join(directory, name) for name in names]
+
+
+def base_generation(path):
+    """Generation of the base gallery at path, which new deltas must record"""
+    return read_header(path)["generation"] if os.path.exists(path) else 0
+
+
+def next_delta_path(path):
+    existing = delta_paths(path)
+    seq = int(existing[-1].rsplit('.d', 1)[1]) + 1 if existing else 1
+    return f"{path}.d{seq:06d}"
+
+
+def write_delta(path, added, removed, model_version=MODEL_VERSION):
+    """Append a delta to the gallery at path
+
+    added is a list of (student_id, encoding) pairs and removed a list of
+    student ids. Returns the delta file path.
+    """
+    delta_path = next_delta_path(path)
+    with GalleryWriter(delta_path, model_version=model_version, delta=True,
+                       generation=base_generation(path)) as writer:
+        for student_id in removed:
+            writer.remove(student_id)
+        for student_id, encoding in added:
+            writer.add(student_id, encoding)
+    return delta_path
+
+
+def clear_deltas(path):
+    for delta_path in delta_paths(path):
+        os.remove(delta_path)
+
+
+def apply_delta(encodings, ids, delta):
+    """Apply one delta to an (encodings, ids) pair and return the new pair
+
+    Ids added by a delta replace any existing rows for the same ids, so
+    applying a delta twice gives the same result as applying it once.
+    """
+    dropped = set(delta.removed) | set(delta.ids)
+    keep = [i for i, student_id in enumerate(ids) if student_id not in dropped]
+    encodings = np.concatenate([np.asarray(encodings)[keep],
+                                np.asarray(delta.encodings, dtype=np.float32)], axis=0)
+    return encodings, [ids[i] for i in keep] + list(delta.ids)
+
+
+def load_gallery(path, verify=False, model_version=None):
+    """Open a base gallery and apply any pending deltas on top of it
+
+    With no deltas the encodings stay memory-mapped; otherwise the merged
+    gallery is materialized in memory until the next compaction. Deltas
+    written against an earlier base (left over from a rebuild that has not
+    cleared them yet) are skipped.
+    """
+    base = open_gallery(path, verify, model_version)
+    deltas = [delta for delta in (open_gallery(delta_path, verify, model_version) for delta_path in delta_paths(path))
+              if delta.generation == base.generation]
+    if not deltas:
+        return base
+
+    encodings, ids = base.encodings, base.ids
+    for delta in deltas:
+        encodings, ids = apply_delta(encodings, ids, delta)
+    return Gallery(path, encodings, ids, base.model_version, generation=base.generation)
+
+
+def compact(path):
+    """Fold all deltas into the base gallery file"""
+    deltas = delta_paths(path)
+    gallery = load_gallery(path, verify=True)
+    # The generation is kept: the folded deltas are idempotent on the new base, and a
+    # delta written meanwhile against the old base still applies on top of it
+    write_gallery(path, gallery.encodings, gallery.ids, gallery.model_version, gallery.generation)
+    for delta_path in deltas:
+        os.remove(delta_path)
+    return len(gallery)
+
+
+def convert_pickle(src, dst, model_version=MODEL_VERSION):
+    """Convert a legacy EncodeFile.p pickle into the binary gallery format
+
+    Only convert pickles you created yourself: unpickling runs arbitrary code.
+    """
+    with open(src, 'rb') as f:
+        encodings, ids = pickle.load(f)
+    write_gallery(dst, encodings, ids, model_version)
+    return len(ids)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage Facetendance gallery files")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    convert = sub.add_parser('convert', help="convert a legacy EncodeFile.p")
+    convert.add_argument('src', nargs='?', default='EncodeFile.p')
+    convert.add_argument('dst', nargs='?', default=DEFAULT_STORE_PATH)
+
+    info = sub.add_parser('info', help="print gallery header and verify the checksum")
+    info.add_argument('path', nargs='?', default=DEFAULT_STORE_PATH)
+
+    compact_cmd = sub.add_parser('compact', help="fold pending deltas into the base gallery")
+    compact_cmd.add_argument('path', nargs='?', default=DEFAULT_STORE_PATH)
+
+    args = parser.parse_args(argv)
+    try:
+        if args.command == 'convert':
+            count = convert_pickle(args.src, args.dst)
+            print(f"Converted {count} encodings from {args.src} to {args.dst}")
+        elif args.command == 'compact':
+            count = compact(args.path)
+            print(f"Compacted {args.path}: {count} encodings")
+        else:
+            gallery = open_gallery(args.path, verify=True)
+            print(f"{args.path}: {len(gallery)} encodings, dim {gallery.encodings.shape[1]}, "
+                  f"model {gallery.model_version}, checksum OK, "
+                  f"{len(delta_paths(args.path))} pending deltas")
+    except (OSError, GalleryFormatError) as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+import os
+import time
+import cv2
+
+# All detectors take an RGB image and return face_recognition style
+# (top, right, bottom, left) boxes in that image's coordinates.
+
+
+class HogDetector:
+    name = "hog"
+
+    def __init__(self, upsample=1):
+        # face_recognition loads its dlib models on import, so it is only imported once a detector is built
+        import face_recognition
+        self.face_locations = face_recognition.face_locations
+        self.upsample = upsample
+
+    def detect(self, rgb):
+        return self.face_locations(rgb, number_of_times_to_upsample=self.upsample, model="hog")
+
+
+class HaarDetector:
+    """OpenCV Haar cascade: much cheaper than HOG, less accurate on turned faces"""
+    name = "haar"
+
+    def __init__(self, cascade_path=None, scale_factor=1.1, min_neighbors=5, min_size=(20, 20)):
+        if cascade_path is None:
+            cascade_path = os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml')
+        self.cascade = cv2.CascadeClassifier(cascade_path)
+        if self.cascade.empty():
+            raise IOError(f"Could not load Haar cascade: {cascade_path}")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+
+    def detect(self, rgb):
+        gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        faces = self.cascade.detectMultiScale(gray, scaleFactor=self.scale_factor,
+                                              minNeighbors=self.min_neighbors, minSize=self.min_size)
+        return [(int(y), int(x + w), int(y + h), int(x)) for (x, y, w, h) in faces]
+
+
+class DnnDetector:
+    """OpenCV DNN res10 SSD face detector on the CPU
+
+    Needs the Caffe model files, which are not shipped with the repo.
+    """
+    name = "dnn"
+
+    def __init__(self, prototxt='models/deploy.prototxt',
+                 model='models/res10_300x300_ssd_iter_140000.caffemodel', confidence=0.5):
+        if not (os.path.exists(prototxt) and os.path.exists(model)):
+            raise IOError(f"DNN face detector model files not found: {prototxt}, {model}")
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, model)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.confidence = confidence
+
+    def detect(self, rgb):
+        h, w = rgb.shape[:2]
+        # The model was trained on BGR input, so swap channels while building the blob
+        blob = cv2.dnn.blobFromImage(rgb, 1.0, (300, 300), (104.0, 177.0, 123.0), swapRB=True)
+        self.net.setInput(blob)
+        detections = self.net.forward()
+        boxes = []
+        for i in range(detections.shape[2]):
+            if detections[0, 0, i, 2] < self.confidence:
+                continue
+            x1, y1, x2, y2 = detections[0, 0, i, 3:7] * [w, h, w, h]
+            x1, y1 = max(0, int(x1)), max(0, int(y1))
+            x2, y2 = min(w, int(x2)), min(h, int(y2))
+            if x2 > x1 and y2 > y1:
+                boxes.append((y1, x2, y2, x1))
+        return boxes
+
+
+class RoiDetector:
+    """Runs a detector only in regions around previous detections"""
+
+    def __init__(self, detector, margin=0.6):
+        self.detector = detector
+        self.margin = margin
+        self.name = f"roi-{detector.name}"
+
+    def detect(self, rgb, previous_boxes):
+        h, w = rgb.shape[:2]
+        found = []
+        for top, right, bottom, left in previous_boxes:
+            mx = int((right - left) * self.margin)
+            my = int((bottom - top) * self.margin)
+            y0, y1 = max(0, top - my), min(h, bottom + my)
+            x0, x1 = max(0, left - mx), min(w, right + mx)
+            if y1 <= y0 or x1 <= x0:
+                continue
+            for t, r, b, l in self.detector.detect(rgb[y0:y1, x0:x1]):
+                box = (t + y0, r + x0, b + y0, l + x0)
+                # Regions of faces close together overlap; keep each face once
+                if all(_overlap(box, other) < 0.5 for other in found):
+                    found.append(box)
+        return found
+
+
+def _overlap(a, b):
+    inter = max(0, min(a[1], b[1]) - max(a[3], b[3])) * max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    smaller = min((a[1] - a[3]) * (a[2] - a[0]), (b[1] - b[3]) * (b[2] - b[0]))
+    return inter / float(smaller) if smaller > 0 else 0.0
+
+
+def create_detectors(names=("hog", "haar", "dnn")):
+    """Instantiate the named detectors, skipping any that are unavailable here"""
+    factories = {"hog": HogDetector, "haar": HaarDetector, "dnn": DnnDetector}
+    detectors = {}
+    for name in names:
+        try:
+            detectors[name] = factories[name]()
+        except Exception as e:
+            print(f"Detector '{name}' unavailable: {e}")
+    return detectors
+
+
+class AdaptiveDetectionController:
+    """Picks the detector and downscale factor for each frame to meet a latency budget
+
+    Levels are ordered from most accurate to fastest. The controller tracks
+    an exponential moving average of detection time and steps one level
+    faster when over budget, or one level more accurate when comfortably
+    under it. Between full-frame passes it searches only around the last
+    detections (ROI mode). Level changes are logged.
+    """
+
+    DEFAULT_LEVELS = (("hog", 0.5), ("hog", 0.33), ("hog", 0.25), ("dnn", 0.5), ("haar", 0.5),
+                      ("haar", 0.33), ("haar", 0.25))
+
+    def __init__(self, detectors=None, target_ms=60.0, levels=DEFAULT_LEVELS, start_level=("hog", 0.25),
+                 full_frame_interval=5, smoothing=0.2, patience=10):
+        self.detectors = detectors if detectors is not None else create_detectors()
+        if not self.detectors:
+            raise ValueError("No face detector is available")
+        self.levels = [level for level in levels if level[0] in self.detectors]
+        self.level = self.levels.index(start_level) if start_level in self.levels else 0
+        self.roi = {name: RoiDetector(detector) for name, detector in self.detectors.items()}
+        self.target_ms = target_ms
+        self.full_frame_interval = full_frame_interval
+        self.smoothing = smoothing
+        self.patience = patience
+        self.latency_ms = None
+        self.under_budget = 0
+        self.frames_since_full = 0
+        self.previous_boxes = []
+        self.last_mode = None
+
+    @property
+    def current(self):
+        return self.levels[self.level]
+
+    def detect(self, img_bgr):
+        """Detect faces in a BGR frame
+
+        Returns (boxes in the scaled image, the scaled RGB image, scale), so
+        the caller can encode faces on the same small image.
+        """
+        name, scale = self.current
+        small = cv2.resize(img_bgr, (0, 0), None, scale, scale)
+        rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+
+        start = time.perf_counter()
+        use_roi = bool(self.previous_boxes) and self.frames_since_full < self.full_frame_interval
+        if use_roi:
+            # previous_boxes are kept in full-frame coordinates so they survive scale changes
+            scaled = [tuple(int(v * scale) for v in box) for box in self.previous_boxes]
+            boxes = self.roi[name].detect(rgb, scaled)
+            self.frames_since_full += 1
+        else:
+            boxes = self.detectors[name].detect(rgb)
+            self.frames_since_full = 0
+        self._adapt((time.perf_counter() - start) * 1000, use_roi)
+
+        self.previous_boxes = [tuple(int(v / scale) for v in box) for box in boxes]
+        self.last_mode = self.roi[name].name if use_roi else name
+        return boxes, rgb, scale
+
+    def _adapt(self, elapsed_ms, roi):
+        # ROI passes are much cheaper than full frames; only full frames drive the budget
+        if roi:
+            return
+        if self.latency_ms is None:
+            self.latency_ms = elapsed_ms
+        else:
+            self.latency_ms += self.smoothing * (elapsed_ms - self.latency_ms)
+
+        previous = self.current
+        if self.latency_ms > self.target_ms * 1.1 and self.level < len(self.levels) - 1:
+            self.level += 1
+            self.under_budget = 0
+        elif self.latency_ms < self.target_ms * 0.5 and self.level > 0:
+            self.under_budget += 1
+            if self.under_budget >= self.patience:
+                self.level -= 1
+                self.under_budget = 0
+        else:
+            self.under_budget = 0
+
+        if self.current != previous:
+            print(f"Detector: {previous[0]}@{previous[1]} -> {self.current[0]}@{self.current[1]} "
+                  f"(avg {self.latency_ms:.1f} ms, budget {self.target_ms:.0f} ms)")
+            # Scales differ between levels, so restart the average at the new level
+            self.latency_ms = None
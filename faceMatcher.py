@@ -0,0 +1,379 @@
+import sys
+import time
+import argparse
+import numpy as np
+
+# Same threshold face_recognition.compare_faces uses by default
+DEFAULT_TOLERANCE = 0.6
+
+
+class FaceMatcher:
+    """Exact gallery matcher holding all known encodings in one float32 matrix"""
+
+    def __init__(self, encodings, ids, tolerance=DEFAULT_TOLERANCE):
+        self.ids = list(ids)
+        self.tolerance = tolerance
+        self.gallery = np.ascontiguousarray(np.asarray(encodings, dtype=np.float32))
+        if self.gallery.size == 0:
+            self.gallery = self.gallery.reshape(0, 128)
+        if self.gallery.shape[0] != len(self.ids):
+            raise ValueError(f"Gallery has {self.gallery.shape[0]} encodings but {len(self.ids)} ids")
+        # Squared norms are reused by every query, so compute them once
+        self.gallery_sq_norms = np.einsum('ij,ij->i', self.gallery, self.gallery)
+
+    def __len__(self):
+        return self.gallery.shape[0]
+
+    def _as_queries(self, encodings):
+        queries = np.asarray(encodings, dtype=np.float32)
+        if queries.size == 0:
+            return queries.reshape(0, self.gallery.shape[1])
+        return np.atleast_2d(queries)
+
+    def distances(self, encodings):
+        """Euclidean distance from every query encoding to every gallery encoding"""
+        queries = self._as_queries(encodings)
+        query_sq_norms = np.einsum('ij,ij->i', queries, queries)
+        # |q - g|^2 = |q|^2 + |g|^2 - 2 q.g, computed for the whole frame in one matmul
+        sq = query_sq_norms[:, None] + self.gallery_sq_norms[None, :] - 2.0 * (queries @ self.gallery.T)
+        np.maximum(sq, 0.0, out=sq)
+        return np.sqrt(sq, out=sq)
+
+    def top_k(self, encodings, k=1):
+        """Return (indices, distances) of the k nearest gallery entries for each query, nearest first"""
+        queries = self._as_queries(encodings)
+        if len(self) == 0 or queries.shape[0] == 0:
+            empty = np.empty((queries.shape[0], 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+
+        dist = self.distances(queries)
+        k = min(k, dist.shape[1])
+        if k < dist.shape[1]:
+            part = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        else:
+            part = np.tile(np.arange(dist.shape[1]), (dist.shape[0], 1))
+        part_dist = np.take_along_axis(dist, part, axis=1)
+        order = np.argsort(part_dist, axis=1)
+        return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_dist, order, axis=1)
+
+    def match(self, encodings):
+        """Best match for each query as a list of (student_id or None, distance)"""
+        indices, dists = self.top_k(encodings, k=1)
+        results = []
+        for row_idx, row_dist in zip(indices, dists):
+            if len(row_idx) == 0 or row_dist[0] > self.tolerance:
+                results.append((None, float(row_dist[0]) if len(row_dist) else float('inf')))
+            else:
+                results.append((self.ids[row_idx[0]], float(row_dist[0])))
+        return results
+
+
+class IVFFaceMatcher(FaceMatcher):
+    """Approximate matcher that partitions the gallery into k-means clusters
+
+    Only the nprobe clusters closest to a query are scanned, which keeps
+    lookups fast for galleries of 100k+ encodings at a small recall cost.
+    The nearest row wins, which is min aggregation. Given centroids (e.g.
+    from with_delta), rows are assigned to them without retraining.
+    """
+
+    index = "ivf"
+    aggregation = "min"
+
+    def __init__(self, encodings, ids, tolerance=DEFAULT_TOLERANCE, n_lists=None, nprobe=8,
+                 train_iterations=10, seed=0, centroids=None):
+        super().__init__(encodings, ids, tolerance)
+        self.k = 1
+        n = len(self)
+        if centroids is not None:
+            self.n_lists = len(centroids)
+            self.nprobe = max(1, min(nprobe, self.n_lists))
+            self.centroids = centroids
+            assignment = _nearest(self.gallery, centroids) if n else np.zeros(0, dtype=np.int64)
+        else:
+            if n_lists is None:
+                n_lists = max(1, int(np.sqrt(n)))
+            self.n_lists = max(1, min(n_lists, n)) if n else 1
+            self.nprobe = max(1, min(nprobe, self.n_lists))
+            self.centroids, assignment = self._train(train_iterations, seed)
+        # Store each cluster's members as a contiguous block for cache-friendly scans
+        self.order = np.argsort(assignment, kind='stable')
+        self.list_offsets = np.searchsorted(assignment[self.order], np.arange(self.n_lists + 1))
+        self.sorted_gallery = np.ascontiguousarray(self.gallery[self.order])
+        self.sorted_sq_norms = self.gallery_sq_norms[self.order]
+
+    def _train(self, iterations, seed):
+        n = len(self)
+        if n == 0:
+            return np.zeros((1, self.gallery.shape[1]), dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+        rng = np.random.default_rng(seed)
+        # Train on a sample so building the index stays cheap for huge galleries
+        sample_size = min(n, self.n_lists * 64)
+        sample = self.gallery[rng.choice(n, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, self.n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            labels = _nearest(sample, centroids)
+            for c in range(self.n_lists):
+                members = sample[labels == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+        return centroids, _nearest(self.gallery, centroids)
+
+    def top_k(self, encodings, k=1):
+        queries = self._as_queries(encodings)
+        n_queries = queries.shape[0]
+        indices = np.full((n_queries, k), -1, dtype=np.int64)
+        dists = np.full((n_queries, k), np.inf, dtype=np.float32)
+        if len(self) == 0 or n_queries == 0:
+            return indices[:, :0], dists[:, :0]
+
+        centroid_dist = _sq_distances(queries, self.centroids)
+        probes = np.argsort(centroid_dist, axis=1)[:, :self.nprobe]
+
+        for q in range(n_queries):
+            rows = np.concatenate([np.arange(self.list_offsets[c], self.list_offsets[c + 1])
+                                   for c in probes[q]])
+            if len(rows) == 0:
+                continue
+            query = queries[q]
+            sq = self.sorted_sq_norms[rows] + query @ query - 2.0 * (self.sorted_gallery[rows] @ query)
+            np.maximum(sq, 0.0, out=sq)
+            kk = min(k, len(rows))
+            best = np.argpartition(sq, kk - 1)[:kk] if kk < len(rows) else np.arange(len(rows))
+            best = best[np.argsort(sq[best])]
+            indices[q, :kk] = self.order[rows[best]]
+            dists[q, :kk] = np.sqrt(sq[best])
+
+        k = min(k, len(self))
+        return indices[:, :k], dists[:, :k]
+
+    def with_delta(self, removed, ids, encodings):
+        """Return a new matcher with a gallery delta applied (see MultiTemplateMatcher.with_delta)
+
+        The clusters are kept, so a delta costs one assignment pass instead
+        of retraining; a full reload retrains them.
+        """
+        dropped = set(removed) | set(ids)
+        keep = np.fromiter((sid not in dropped for sid in self.ids), dtype=bool, count=len(self.ids))
+        new_encodings = np.asarray(encodings, dtype=np.float32).reshape(len(ids), self.gallery.shape[1])
+        return IVFFaceMatcher(np.vstack([self.gallery[keep], new_encodings]),
+                              [sid for sid, kept in zip(self.ids, keep) if kept] + list(ids),
+                              self.tolerance, nprobe=self.nprobe, centroids=self.centroids)
+
+
+AGGREGATIONS = ("min", "centroid", "knn")
+
+
+class MultiTemplateMatcher(FaceMatcher):
+    """Matcher for galleries with several templates (rows) per student
+
+    Rows of one student are grouped, and each query is scored per student
+    in a single pass over the distance matrix:
+
+    - min: distance to the student's closest template (nearest row)
+    - centroid: distance to the mean of the student's templates
+    - knn: among the k nearest rows within tolerance, the student with most
+      rows wins, ties going to the closer one; its distance is that of its
+      closest row
+
+    Templates added from live captures (see LiveTemplatePolicy) are marked
+    in `live` and are the only rows ever evicted.
+    """
+
+    index = "exact"
+
+    def __init__(self, encodings, ids, tolerance=DEFAULT_TOLERANCE, aggregation="min", k=3, live=None):
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation {aggregation!r}, expected one of {AGGREGATIONS}")
+        super().__init__(encodings, ids, tolerance)
+        self.aggregation = aggregation
+        self.k = k
+        self.live = np.zeros(len(self), dtype=bool) if live is None else np.asarray(live, dtype=bool)
+
+        # Student label of every row, so per-student reductions are array operations
+        self.student_index = {}
+        self.labels = np.fromiter((self.student_index.setdefault(sid, len(self.student_index))
+                                   for sid in self.ids), dtype=np.int64, count=len(self.ids))
+        self.students = list(self.student_index)
+        self.template_counts = np.bincount(self.labels, minlength=len(self.students))
+
+        self.centroids = None
+        if aggregation == "centroid":
+            sums = np.zeros((len(self.students), self.gallery.shape[1]), dtype=np.float64)
+            np.add.at(sums, self.labels, self.gallery)
+            means = (sums / np.maximum(self.template_counts, 1)[:, None]).astype(np.float32)
+            self.centroids = FaceMatcher(means, self.students, tolerance)
+
+    def match(self, encodings):
+        if self.aggregation == "min":
+            # The nearest row is the student's closest template
+            return super().match(encodings)
+        if self.aggregation == "centroid":
+            return self.centroids.match(encodings)
+
+        indices, dists = self.top_k(encodings, self.k)
+        results = []
+        for row_idx, row_dist in zip(indices, dists):
+            if len(row_idx) == 0:
+                results.append((None, float('inf')))
+                continue
+            # Only templates within tolerance vote, so distant rows cannot outvote a close one
+            close = row_dist <= self.tolerance
+            if not close.any():
+                results.append((None, float(row_dist[0])))
+                continue
+            labels = self.labels[row_idx[close]]
+            votes = np.bincount(labels)
+            candidates = np.flatnonzero(votes == votes.max())
+            # Rows are sorted nearest first, so the first row of a label is its closest
+            best = {label: row_dist[close][np.argmax(labels == label)] for label in candidates}
+            label = min(best, key=best.get)
+            results.append((self.students[label], float(best[label])))
+        return results
+
+    def templates(self, student_id):
+        """Row indices of a student's templates, oldest first"""
+        label = self.student_index.get(student_id)
+        return [] if label is None else np.flatnonzero(self.labels == label).tolist()
+
+    def with_template(self, student_id, encoding, max_templates=5):
+        """Return a new matcher with one more template for the student, or None
+
+        When the student is at the cap, the oldest live template makes room;
+        enrolled templates are never evicted. The matcher itself is not
+        modified, so it can be swapped in while other threads still use the
+        old one.
+        """
+        rows = self.templates(student_id)
+        keep = np.ones(len(self), dtype=bool)
+        if len(rows) >= max_templates:
+            live_rows = [i for i in rows if self.live[i]]
+            if not live_rows:
+                return None
+            keep[live_rows[0]] = False
+        return self._rebuilt(keep, [student_id], [encoding], live=True)
+
+    def with_delta(self, removed, ids, encodings):
+        """Return a new matcher with a gallery delta applied
+
+        Same semantics as encodingStore.apply_delta: the delta's ids replace
+        all existing rows of those students, including live templates. Live
+        templates of other students are kept.
+        """
+        dropped = set(removed) | set(ids)
+        keep = np.fromiter((sid not in dropped for sid in self.ids), dtype=bool, count=len(self.ids))
+        return self._rebuilt(keep, list(ids), encodings, live=False)
+
+    def _rebuilt(self, keep, new_ids, new_encodings, live):
+        new_encodings = np.asarray(new_encodings, dtype=np.float32).reshape(len(new_ids), self.gallery.shape[1])
+        return MultiTemplateMatcher(np.vstack([self.gallery[keep], new_encodings]),
+                                    [sid for sid, kept in zip(self.ids, keep) if kept] + new_ids,
+                                    self.tolerance, self.aggregation, self.k,
+                                    live=np.append(self.live[keep], np.full(len(new_ids), live)))
+
+
+class LiveTemplatePolicy:
+    """Decides when a live capture becomes a new template
+
+    Only captures that matched confidently (distance at most max_distance)
+    but are not near-duplicates of an existing template (at least
+    min_distance away) are added, at most once per min_interval seconds per
+    student. Live templates are kept in memory and are gone after a restart
+    or gallery reload.
+    """
+
+    def __init__(self, max_distance=0.35, min_distance=0.15, max_templates=5, min_interval=600.0):
+        self.max_distance = max_distance
+        self.min_distance = min_distance
+        self.max_templates = max_templates
+        self.min_interval = min_interval
+        self.last_added = {}
+        self.added = 0
+
+    def consider(self, matcher, student_id, encoding, distance, now):
+        """Return a matcher with the capture added, or None to keep the current one"""
+        if not self.min_distance <= distance <= self.max_distance:
+            return None
+        if now - self.last_added.get(student_id, float('-inf')) < self.min_interval:
+            return None
+        updated = matcher.with_template(student_id, encoding, self.max_templates)
+        if updated is not None:
+            self.last_added[student_id] = now
+            self.added += 1
+        return updated
+
+
+def _sq_distances(a, b):
+    sq = np.einsum('ij,ij->i', a, a)[:, None] + np.einsum('ij,ij->i', b, b)[None, :] - 2.0 * (a @ b.T)
+    return np.maximum(sq, 0.0, out=sq)
+
+
+def _nearest(points, centroids, chunk=65536):
+    labels = np.empty(len(points), dtype=np.int64)
+    for start in range(0, len(points), chunk):
+        labels[start:start + chunk] = np.argmin(_sq_distances(points[start:start + chunk], centroids), axis=1)
+    return labels
+
+
+INDEXES = ("exact", "ivf")
+
+
+def build_matcher(encodings, ids, tolerance=DEFAULT_TOLERANCE, index="exact", aggregation="min", k=3, nprobe=8):
+    """Create an exact matcher, or an IVF matcher for index="ivf"
+
+    The IVF matcher returns the nearest row, which is min aggregation.
+    """
+    if index not in INDEXES:
+        raise ValueError(f"Unknown index {index!r}, expected one of {INDEXES}")
+    if index == "ivf":
+        if aggregation != "min":
+            print(f"Warning: the ivf index always uses min aggregation, ignoring {aggregation!r}")
+        return IVFFaceMatcher(encodings, ids, tolerance, nprobe=nprobe)
+    return MultiTemplateMatcher(encodings, ids, tolerance, aggregation, k)
+
+
+def benchmark(sizes, n_queries=5, repeats=20, k=1, nprobe=8, seed=0):
+    """Time batched matching on random galleries of increasing size"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for size in sizes:
+        gallery = rng.normal(size=(size, 128)).astype(np.float32) * 0.1
+        ids = [str(i) for i in range(size)]
+        # Queries are perturbed gallery members so recall can be checked
+        truth = rng.choice(size, n_queries)
+        queries = gallery[truth] + rng.normal(size=(n_queries, 128)).astype(np.float32) * 0.01
+
+        exact = FaceMatcher(gallery, ids)
+        start = time.perf_counter()
+        ivf = IVFFaceMatcher(gallery, ids, nprobe=nprobe)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        for name, matcher in (("exact", exact), ("ivf", ivf)):
+            matcher.top_k(queries, k)  # warm up
+            start = time.perf_counter()
+            for _ in range(repeats):
+                found, _ = matcher.top_k(queries, k)
+            latency_ms = (time.perf_counter() - start) * 1000 / repeats
+            recall = float(np.mean(found[:, 0] == truth))
+            rows.append((size, name, latency_ms, recall, build_ms if name == "ivf" else 0.0))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark gallery matching latency vs gallery size")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=5, help="faces per frame")
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--nprobe', type=int, default=8)
+    args = parser.parse_args(argv)
+
+    print(f"{'gallery':>10} {'matcher':>8} {'ms/frame':>10} {'recall@1':>9} {'build ms':>9}")
+    for size, name, latency_ms, recall, build_ms in benchmark(args.sizes, args.queries,
+                                                               args.repeats, nprobe=args.nprobe):
+        print(f"{size:>10} {name:>8} {latency_ms:>10.3f} {recall:>9.2f} {build_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import threading
+from collections import Counter
+import cv2
+import numpy as np
+
+# Reasons a face can be rejected, in the order the checks run (cheapest first)
+REASONS = ("small", "dark", "bright", "blurry", "no_landmarks", "pose")
+
+# Faces are resampled to this width before measuring sharpness, so the
+# threshold means the same at every detector scale and photo size
+SHARPNESS_WIDTH = 64
+
+
+class FaceQualityGate:
+    """Cheap checks that reject faces not worth encoding
+
+    Size, brightness and blur are measured on the face crop; pose comes from
+    the 5-point landmarks (nose offset from the eye midpoint relative to the
+    eye distance, about 0 when frontal and 0.5 or more in profile). Boxes are
+    (top, right, bottom, left) in the coordinates of the image passed in;
+    min_size is in 0.25x-scaled frame pixels, whatever scale the image has.
+    """
+
+    def __init__(self, min_size=16, min_brightness=40.0, max_brightness=220.0, min_sharpness=60.0,
+                 max_yaw=0.35, check_pose=True):
+        self.min_size = min_size
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.min_sharpness = min_sharpness
+        self.max_yaw = max_yaw
+        self.check_pose = check_pose
+        self.checked = 0
+        self.rejections = Counter()
+        self.lock = threading.Lock()
+
+    def params(self):
+        """Settings that change which faces pass; part of the enrollment cache key"""
+        return {"min_size": self.min_size, "min_brightness": self.min_brightness,
+                "max_brightness": self.max_brightness, "min_sharpness": self.min_sharpness,
+                "max_yaw": self.max_yaw if self.check_pose else None}
+
+    def assess(self, rgb, box, scale=0.25):
+        """Return the rejection reason for one face, or None if it is good enough to encode"""
+        top, right, bottom, left = box
+        if min(bottom - top, right - left) * 0.25 / scale < self.min_size:
+            return "small"
+
+        h, w = rgb.shape[:2]
+        crop = rgb[max(top, 0):min(bottom, h), max(left, 0):min(right, w)]
+        if crop.size == 0:
+            return "small"
+        gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+        brightness = float(gray.mean())
+        if brightness < self.min_brightness:
+            return "dark"
+        if brightness > self.max_brightness:
+            return "bright"
+
+        height = max(1, round(gray.shape[0] * SHARPNESS_WIDTH / gray.shape[1]))
+        gray = cv2.resize(gray, (SHARPNESS_WIDTH, height), interpolation=cv2.INTER_AREA)
+        if cv2.Laplacian(gray, cv2.CV_64F).var() < self.min_sharpness:
+            return "blurry"
+
+        if self.check_pose:
+            import face_recognition
+
+            landmarks = face_recognition.face_landmarks(rgb, [box], model='small')
+            if not landmarks:
+                return "no_landmarks"
+            yaw = estimate_yaw(landmarks[0])
+            if yaw is None:
+                return "no_landmarks"
+            if abs(yaw) > self.max_yaw:
+                return "pose"
+        return None
+
+    def filter(self, rgb, boxes, scale=0.25):
+        """Return the indices of boxes that pass, counting rejections by reason"""
+        accepted = []
+        rejected = Counter()
+        for i, box in enumerate(boxes):
+            reason = self.assess(rgb, box, scale)
+            if reason is None:
+                accepted.append(i)
+            else:
+                rejected[reason] += 1
+        with self.lock:
+            self.checked += len(boxes)
+            self.rejections.update(rejected)
+        return accepted, rejected
+
+    def stats(self):
+        with self.lock:
+            return {"checked": self.checked, "rejected": dict(self.rejections)}
+
+
+def estimate_yaw(landmarks):
+    """Signed horizontal nose offset from the eye midpoint, in eye distances"""
+    try:
+        left_eye = np.mean(landmarks['left_eye'], axis=0)
+        right_eye = np.mean(landmarks['right_eye'], axis=0)
+        nose = np.mean(landmarks['nose_tip'], axis=0)
+    except (KeyError, ValueError):
+        return None
+    eye_distance = np.linalg.norm(right_eye - left_eye)
+    if eye_distance < 1e-6:
+        return None
+    midpoint = (left_eye + right_eye) / 2
+    # Project onto the eye line so head roll does not read as yaw
+    axis = (right_eye - left_eye) / eye_distance
+    return float(np.dot(nose - midpoint, axis) / eye_distance)
@@ -0,0 +1,131 @@
+import itertools
+from collections import Counter, deque
+
+
+def iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    if inter == 0:
+        return 0.0
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    return inter / float(area_a + area_b - inter)
+
+
+def centroid(box):
+    return (box[1] + box[3]) / 2.0, (box[0] + box[2]) / 2.0
+
+
+class Track:
+    """One face followed across frames, with its identity votes"""
+
+    def __init__(self, track_id, box, vote_window):
+        self.track_id = track_id
+        self.box = box
+        self.age = 0
+        self.misses = 0
+        self.votes = deque(maxlen=vote_window)
+        self.identity = None
+        self.distance = None
+        self.frames_since_encoding = 0
+        self.unknown_streak = 0
+
+    def add_vote(self, student_id, distance, min_votes):
+        """Record one match result and re-vote the identity over the recent window"""
+        self.votes.append((student_id, distance))
+        self.frames_since_encoding = 0
+        self.unknown_streak = self.unknown_streak + 1 if student_id is None else 0
+        counts = Counter(vote for vote, _ in self.votes if vote is not None)
+        if not counts:
+            self.identity = None
+            return
+        best, count = counts.most_common(1)[0]
+        if count >= min_votes:
+            self.identity = best
+            self.distance = min(d for vote, d in self.votes if vote == best)
+        elif self.identity is not None and best != self.identity:
+            # The old identity lost the vote without a clear replacement
+            self.identity = None
+
+
+class FaceTracker:
+    """Associates face boxes across frames by IoU, falling back to centroid distance
+
+    Encoding and matching only need to run for tracks that are new, not yet
+    confirmed by min_votes agreeing matches, or whose identity is older than
+    refresh_interval frames. A face that stays unmatched for unknown_votes
+    encodings in a row (a visitor) is re-encoded at a doubling interval, up
+    to max_unknown_interval frames.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_centroid_shift=0.5, max_misses=5, vote_window=5,
+                 min_votes=3, refresh_interval=30, unknown_votes=5, max_unknown_interval=15):
+        self.iou_threshold = iou_threshold
+        self.max_centroid_shift = max_centroid_shift
+        self.max_misses = max_misses
+        self.vote_window = vote_window
+        self.min_votes = min_votes
+        self.refresh_interval = refresh_interval
+        self.unknown_votes = unknown_votes
+        self.max_unknown_interval = max_unknown_interval
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def update(self, boxes):
+        """Associate this frame's boxes with tracks; returns the track for each box"""
+        assigned = [None] * len(boxes)
+        free_tracks = set(range(len(self.tracks)))
+
+        pairs = sorted(((iou(track.box, box), t, b) for t, track in enumerate(self.tracks)
+                        for b, box in enumerate(boxes)), reverse=True)
+        for score, t, b in pairs:
+            if score < self.iou_threshold:
+                break
+            if t in free_tracks and assigned[b] is None:
+                assigned[b] = self.tracks[t]
+                free_tracks.discard(t)
+
+        # Fast-moving faces may not overlap their previous box; match them by centroid
+        for b, box in enumerate(boxes):
+            if assigned[b] is not None:
+                continue
+            cx, cy = centroid(box)
+            size = max(box[1] - box[3], box[2] - box[0], 1)
+            best, best_shift = None, self.max_centroid_shift
+            for t in free_tracks:
+                tx, ty = centroid(self.tracks[t].box)
+                shift = ((cx - tx) ** 2 + (cy - ty) ** 2) ** 0.5 / size
+                if shift < best_shift:
+                    best, best_shift = t, shift
+            if best is not None:
+                assigned[b] = self.tracks[best]
+                free_tracks.discard(best)
+
+        for t in free_tracks:
+            self.tracks[t].misses += 1
+        for b, box in enumerate(boxes):
+            track = assigned[b]
+            if track is None:
+                track = Track(next(self._ids), box, self.vote_window)
+                self.tracks.append(track)
+                assigned[b] = track
+            track.box = box
+            track.age += 1
+            track.misses = 0
+            track.frames_since_encoding += 1
+
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+        return assigned
+
+    def needs_encoding(self, track):
+        if track.identity is not None:
+            return track.frames_since_encoding >= self.refresh_interval
+        if track.unknown_streak < self.unknown_votes:
+            return True
+        backoff = min(self.max_unknown_interval, 2 ** (track.unknown_streak - self.unknown_votes + 1))
+        return track.frames_since_encoding >= backoff
+
+    def add_match(self, track, student_id, distance):
+        track.add_vote(student_id, distance, self.min_votes)
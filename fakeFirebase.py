@@ -0,0 +1,192 @@
+import copy
+import time
+import base64
+import hashlib
+import threading
+
+
+class FakeNetworkError(Exception):
+    """Raised by the fake database while it is set offline"""
+
+
+class FakeDb:
+    """In-memory stand-in for the parts of firebase_admin.db this project uses
+
+    Pass an instance wherever the code expects the firebase_admin.db module
+    (e.g. FirebaseAttendanceBackend(FakeDb())) to run without a network.
+    Multi-path update() and the {".sv": {"increment": n}} server value are
+    supported, and offline / fail_next() simulate network failures.
+    """
+
+    def __init__(self, data=None):
+        self.data = copy.deepcopy(data) if data is not None else {}
+        self.lock = threading.RLock()
+        self.offline = False
+        self.failures = 0
+        self.calls = {"get": 0, "set": 0, "update": 0, "transaction": 0}
+
+    def reference(self, path='/'):
+        return FakeReference(self, _split(path))
+
+    def fail_next(self, count=1):
+        self.failures = count
+
+    def _check_network(self, op):
+        self.calls[op] += 1
+        if self.offline:
+            raise FakeNetworkError("fake database is offline")
+        if self.failures:
+            self.failures -= 1
+            raise FakeNetworkError("injected failure")
+
+    def _get(self, parts):
+        node = self.data
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return copy.deepcopy(node)
+
+    def _set(self, parts, value):
+        if not parts:
+            self.data = copy.deepcopy(value) if value is not None else {}
+            return
+        node = self.data
+        for part in parts[:-1]:
+            if not isinstance(node.get(part), dict):
+                node[part] = {}
+            node = node[part]
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = _resolve(copy.deepcopy(value), node.get(parts[-1]))
+
+
+class FakeReference:
+    def __init__(self, db, parts):
+        self._db = db
+        self._parts = parts
+        self.path = '/' + '/'.join(parts)
+
+    @property
+    def key(self):
+        return self._parts[-1] if self._parts else None
+
+    def child(self, path):
+        return FakeReference(self._db, self._parts + _split(path))
+
+    def get(self, shallow=False):
+        with self._db.lock:
+            self._db._check_network("get")
+            value = self._db._get(self._parts)
+        if shallow and isinstance(value, dict):
+            # Like the REST shallow query: children are replaced by True
+            return {key: True for key in value}
+        return value
+
+    def set(self, value):
+        with self._db.lock:
+            self._db._check_network("set")
+            self._db._set(self._parts, value)
+
+    def update(self, value):
+        # All paths are applied under one lock, like the atomic multi-path update
+        with self._db.lock:
+            self._db._check_network("update")
+            for path, child_value in value.items():
+                self._db._set(self._parts + _split(path), child_value)
+
+    def transaction(self, transaction_update):
+        with self._db.lock:
+            self._db._check_network("transaction")
+            result = transaction_update(self._db._get(self._parts))
+            self._db._set(self._parts, result)
+            return result
+
+
+class FakeBucket:
+    """In-memory stand-in for the parts of a firebase_admin.storage bucket this project uses
+
+    Blobs carry a base64 MD5 like Cloud Storage. latency (seconds per
+    upload) makes concurrency measurable; offline and fail_next() simulate
+    network failures as in FakeDb.
+    """
+
+    def __init__(self, latency=0.0):
+        self.objects = {}
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.offline = False
+        self.failures = 0
+        self.calls = {"upload": 0, "list": 0, "get": 0}
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        with self.lock:
+            self._check_network("get")
+            if name not in self.objects:
+                return None
+        return self._loaded(name)
+
+    def list_blobs(self, prefix=''):
+        with self.lock:
+            self._check_network("list")
+            names = sorted(name for name in self.objects if name.startswith(prefix))
+        return [self._loaded(name) for name in names]
+
+    def fail_next(self, count=1):
+        with self.lock:
+            self.failures = count
+
+    def _loaded(self, name):
+        blob = FakeBlob(self, name)
+        blob.md5_hash = _md5_b64(self.objects[name])
+        return blob
+
+    def _check_network(self, op):
+        """Caller must hold the lock"""
+        self.calls[op] += 1
+        if self.offline:
+            raise FakeNetworkError("fake bucket is offline")
+        if self.failures:
+            self.failures -= 1
+            raise FakeNetworkError("injected failure")
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.md5_hash = None
+
+    def upload_from_filename(self, filename):
+        with open(filename, 'rb') as f:
+            data = f.read()
+        with self.bucket.lock:
+            self.bucket._check_network("upload")
+        if self.bucket.latency:
+            time.sleep(self.bucket.latency)
+        with self.bucket.lock:
+            self.bucket.objects[self.name] = data
+        self.md5_hash = _md5_b64(data)
+
+
+def _md5_b64(data):
+    return base64.b64encode(hashlib.md5(data).digest()).decode('ascii')
+
+
+def _split(path):
+    return [part for part in str(path).split('/') if part]
+
+
+def _resolve(value, current):
+    """Apply {".sv": {"increment": n}} server values against the current value"""
+    if isinstance(value, dict):
+        if set(value) == {".sv"} and isinstance(value[".sv"], dict) and "increment" in value[".sv"]:
+            base = current if isinstance(current, (int, float)) else 0
+            return base + value[".sv"]["increment"]
+        return {k: _resolve(v, current.get(k) if isinstance(current, dict) else None)
+                for k, v in value.items()}
+    return value
@@ -0,0 +1,126 @@
+import time
+import threading
+
+
+class LatestQueue:
+    """Single-slot queue that always holds the newest item
+
+    A slow consumer never builds up a backlog: putting a new item replaces
+    an unread one, which is counted as dropped.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._has_item = False
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._has_item:
+                self.dropped += 1
+            self._item = item
+            self._has_item = True
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Wait for the next item; returns None on timeout or once closed"""
+        with self._cond:
+            if not self._has_item and not self._closed:
+                self._cond.wait(timeout)
+            if not self._has_item:
+                return None
+            item = self._item
+            self._item = None
+            self._has_item = False
+            return item
+
+    def get_nowait(self):
+        return self.get(timeout=0)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class StageStats:
+    """Throughput counters for one pipeline stage"""
+
+    def __init__(self, name, window=2.0):
+        self.name = name
+        self.window = window
+        self.count = 0
+        self.busy_seconds = 0.0
+        self.fps = 0.0
+        self._lock = threading.Lock()
+        self._window_start = time.perf_counter()
+        self._window_count = 0
+
+    def record(self, busy_seconds=0.0):
+        with self._lock:
+            self.count += 1
+            self.busy_seconds += busy_seconds
+            self._window_count += 1
+            now = time.perf_counter()
+            elapsed = now - self._window_start
+            if elapsed >= self.window:
+                self.fps = self._window_count / elapsed
+                self._window_start = now
+                self._window_count = 0
+
+    def snapshot(self):
+        with self._lock:
+            avg_ms = self.busy_seconds * 1000 / self.count if self.count else 0.0
+            return {"stage": self.name, "frames": self.count, "fps": round(self.fps, 1),
+                    "avg_ms": round(avg_ms, 2)}
+
+
+class PipelineStage(threading.Thread):
+    """Worker thread that pulls items from a LatestQueue, processes them and
+    pushes results downstream
+
+    With no input queue the stage is a source (e.g. camera capture) and
+    process() is called in a loop; it may return None to skip an output.
+    """
+
+    def __init__(self, name, process, input_queue=None, output_queues=(), poll_timeout=0.5):
+        super().__init__(name=name, daemon=True)
+        self.process = process
+        self.input_queue = input_queue
+        self.output_queues = list(output_queues)
+        self.poll_timeout = poll_timeout
+        self.stats = StageStats(name)
+        self.running = True
+
+    def run(self):
+        while self.running:
+            if self.input_queue is not None:
+                item = self.input_queue.get(self.poll_timeout)
+                if item is None:
+                    continue
+                args = (item,)
+            else:
+                args = ()
+
+            start = time.perf_counter()
+            try:
+                result = self.process(*args)
+            except Exception as e:
+                print(f"Error in {self.name} stage: {e}")
+                continue
+            if result is None:
+                continue
+            self.stats.record(time.perf_counter() - start)
+            for queue in self.output_queues:
+                queue.put(result)
+
+    def stop(self):
+        self.running = False
+        if self.input_queue is not None:
+            self.input_queue.close()
+
+
+def format_stats(stats):
+    return ", ".join(f"{s['stage']}: {s['fps']} fps ({s['avg_ms']} ms)" for s in stats)
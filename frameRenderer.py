@@ -0,0 +1,94 @@
+import sys
+import argparse
+import tracemalloc
+import numpy as np
+import cv2
+from PIL import Image
+
+
+class FrameRenderer:
+    """Converts camera frames for Tk display using buffers allocated once
+
+    The BGR frame is converted straight into a preallocated RGBA buffer, and
+    overlays are drawn into that same buffer. A PIL image wraps the buffer
+    without copying (RGBA is one of the modes PIL can map in place). A
+    single PhotoImage is created once and updated in place with paste().
+    Overlay colors are therefore RGB(A), not BGR.
+    """
+
+    def __init__(self, width=500, height=500):
+        self.size = (width, height)
+        self.resized = np.empty((height, width, 3), dtype=np.uint8)
+        self.rgba = np.empty((height, width, 4), dtype=np.uint8)
+        self.image = Image.frombuffer('RGBA', self.size, self.rgba, 'raw', 'RGBA', 0, 1)
+        self.photo = None
+
+    def render(self, frame_bgr, draw=None):
+        """Convert a BGR frame into the display buffer and draw overlays on it"""
+        if frame_bgr.shape[1::-1] != self.size:
+            cv2.resize(frame_bgr, self.size, dst=self.resized)
+            frame_bgr = self.resized
+        cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGBA, dst=self.rgba)
+        if draw is not None:
+            draw(self.rgba)
+        return self.rgba
+
+    def photo_image(self):
+        """The persistent PhotoImage holding the last rendered frame; Tk main thread only"""
+        from PIL import ImageTk
+
+        if self.photo is None:
+            self.photo = ImageTk.PhotoImage(self.image)
+        else:
+            self.photo.paste(self.image)
+        return self.photo
+
+
+def legacy_render(frame_bgr):
+    """The original per-frame path, kept for allocation comparisons"""
+    img = cv2.resize(frame_bgr, (500, 500))
+    img_display = img.copy()
+    img_display = cv2.cvtColor(img_display, cv2.COLOR_BGR2RGB)
+    return Image.fromarray(img_display)
+
+
+def count_peak_bytes(fn, frames):
+    """Average peak traced memory per call of fn(frame)
+
+    numpy and Pillow report their buffers to tracemalloc, so every transient
+    full-frame buffer shows up in the peak.
+    """
+    fn(frames[0])
+    peaks = []
+    for frame in frames:
+        tracemalloc.start()
+        fn(frame)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return sum(peaks) / len(peaks)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare per-frame allocations of the render paths")
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 255, (args.height, args.width, 3), dtype=np.uint8) for _ in range(args.frames)]
+    renderer = FrameRenderer()
+
+    def draw(buf):
+        cv2.rectangle(buf, (100, 100), (300, 300), (0, 255, 0, 255), 2)
+
+    frame_bytes = 500 * 500 * 3
+    for name, fn in (("legacy", legacy_render), ("reuse", lambda f: renderer.render(f, draw))):
+        peak = count_peak_bytes(fn, frames)
+        print(f"{name:>7}: peak {peak / 1024:.0f} KiB allocated per frame "
+              f"(~{peak / frame_bytes:.1f} full-frame buffers)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
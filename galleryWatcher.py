@@ -0,0 +1,134 @@
+import os
+import time
+import signal
+import threading
+from metrics import METRICS
+from encodingStore import delta_paths, open_gallery, base_generation, MODEL_VERSION
+
+
+def store_signature(path):
+    """What identifies the current store contents: the base file's identity and the delta list"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns), tuple(delta_paths(path))
+
+
+class GalleryWatcher:
+    """Reloads the gallery into running engines when the store changes
+
+    The store is polled every poll_interval seconds (or checked at once on
+    request, e.g. from SIGHUP). A change is only loaded once it has been
+    stable for one poll, so a half-finished enrollment is not picked up.
+    New deltas on an unchanged base are applied incrementally to each
+    engine's matcher; a rewritten base (full enrollment, compaction) is
+    loaded whole. Loading happens on the watcher thread and the result is
+    swapped in with RecognitionEngine.update_matcher, so frames in flight
+    finish on the matcher they started with.
+
+    loaded is the store_signature taken before the engines' gallery was
+    loaded, so a change made while it was loading is picked up on the
+    first poll; by default the store is assumed unchanged since the load.
+    """
+
+    def __init__(self, path, engines, poll_interval=2.0, loaded=None):
+        self.path = path
+        self.engines = list(engines)
+        self.poll_interval = poll_interval
+        self.loaded = loaded if loaded is not None else store_signature(path)
+        self.seen = self.loaded
+        self.reloads = 0
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="gallery-watcher", daemon=True)
+        self.thread.start()
+        return self
+
+    def request_reload(self):
+        """Check the store now; safe to call from a signal handler"""
+        self.wakeup.set()
+
+    def _run(self):
+        while self.running:
+            forced = self.wakeup.wait(self.poll_interval if self.poll_interval > 0 else None)
+            self.wakeup.clear()
+            if not self.running:
+                break
+            try:
+                self.check(forced)
+            except Exception as e:
+                print(f"Error reloading gallery, keeping the current one: {e}")
+
+    def check(self, forced=False):
+        """Reload if the store changed; returns True when a new gallery was swapped in"""
+        current = store_signature(self.path)
+        stable = current == self.seen
+        self.seen = current
+        if current is None or current == self.loaded or not (stable or forced):
+            return False
+
+        start = time.perf_counter()
+        with METRICS.time("gallery_reload"):
+            base, deltas = current
+            incremental = (self.loaded is not None and base == self.loaded[0]
+                           and deltas[:len(self.loaded[1])] == self.loaded[1])
+            if incremental:
+                mode = self._apply_deltas(deltas[len(self.loaded[1]):])
+            else:
+                mode = self._reload()
+        self.loaded = current
+        self.reloads += 1
+        METRICS.inc("gallery_reloads")
+        sizes = sorted({len(engine.matcher) for engine in self.engines})
+        print(f"Gallery reloaded ({mode}): {'/'.join(str(n) for n in sizes)} encodings "
+              f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return True
+
+    def _apply_deltas(self, new_deltas):
+        generation = base_generation(self.path)
+        deltas = [delta for delta in (open_gallery(path, model_version=MODEL_VERSION) for path in new_deltas)
+                  if delta.generation == generation]
+        # Engines holding the same matcher get the same new one, so the gallery
+        # is rebuilt once, not once per camera
+        built = {}
+
+        def apply(matcher):
+            if id(matcher) not in built:
+                updated = matcher
+                for delta in deltas:
+                    updated = updated.with_delta(delta.removed, delta.ids, delta.encodings)
+                built[id(matcher)] = (matcher, updated)
+            return built[id(matcher)][1]
+
+        for engine in self.engines:
+            engine.update_matcher(apply)
+        return f"{len(deltas)} new deltas"
+
+    def _reload(self):
+        from recognitionEngine import load_matcher
+
+        reference = self.engines[0].matcher
+        matcher = load_matcher(self.path, reference.aggregation, reference.k, reference.index,
+                               getattr(reference, "nprobe", 8))
+        for engine in self.engines:
+            # Live templates were built on the old gallery and are dropped with it
+            engine.update_matcher(lambda _: matcher)
+        return "full"
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout=2.0)
+
+
+def install_reload_signal(watcher, signum=getattr(signal, 'SIGHUP', None)):
+    """Reload the gallery on a signal (SIGHUP by default), e.g. after enrollment"""
+    if signum is None:
+        return
+    signal.signal(signum, lambda received, frame: watcher.request_reload())
@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+manifestFile = 'UploadManifest.json'
+
+
+def list_image_paths(folder):
+    """Image paths relative to the folder, including one level of per-student subfolders"""
+    paths = []
+    for name in os.listdir(folder):
+        full = os.path.join(folder, name)
+        if os.path.isdir(full):
+            paths.extend(f"{name}/{child}" for child in os.listdir(full)
+                         if os.path.isfile(os.path.join(full, child)))
+        else:
+            paths.append(name)
+    return sorted(paths)
+
+
+def file_md5(path, chunk_size=1 << 20):
+    """Base64 MD5 of a file, the same form Cloud Storage reports as blob.md5_hash"""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return base64.b64encode(digest.digest()).decode('ascii')
+
+
+class UploadManifest:
+    """Which local files are known to be in the bucket, by MD5
+
+    Saved atomically every save_every uploads and when the run ends, so an
+    interrupted run resumes where it stopped. Size and mtime are stored too,
+    so unchanged files are not re-hashed on the next run.
+    """
+
+    def __init__(self, path=manifestFile, save_every=50):
+        self.path = path
+        self.save_every = save_every
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.unsaved = 0
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Warning: ignoring unreadable upload manifest {path}: {e}")
+
+    def local_md5(self, name, filename):
+        """MD5 of the file, reusing the recorded one while size and mtime are unchanged"""
+        st = os.stat(filename)
+        with self.lock:
+            entry = self.entries.get(name)
+        if entry is not None and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+            return entry["md5"], entry.get("uploaded", False)
+        return file_md5(filename), False
+
+    def record(self, name, filename, md5):
+        st = os.stat(filename)
+        with self.lock:
+            self.entries[name] = {"md5": md5, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "uploaded": True}
+            self.unsaved += 1
+            if self.unsaved >= self.save_every:
+                self._save()
+
+    def save(self):
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        """Caller must hold the lock"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+        self.unsaved = 0
+
+
+class ImageUploader:
+    """Uploads a folder of images to a storage bucket with bounded concurrency
+
+    A file is skipped when the manifest says it was uploaded unchanged, or
+    when the remote blob already has the same MD5 (one listing per run,
+    fetched only if some file is not in the manifest). Failed uploads are
+    retried with exponential backoff and jitter; files that still fail are
+    reported and left out of the manifest, so the next run retries them.
+    bucket is a firebase_admin.storage bucket or fakeFirebase.FakeBucket.
+    """
+
+    def __init__(self, bucket, manifest=None, workers=8, max_attempts=5, base_delay=0.5, max_delay=30.0):
+        self.bucket = bucket
+        self.manifest = manifest if manifest is not None else UploadManifest()
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.remote = None
+        self.remote_lock = threading.Lock()
+
+    def remote_md5(self, name, prefix):
+        """MD5 of the remote blob, listing the bucket prefix once on first use"""
+        with self.remote_lock:
+            if self.remote is None:
+                try:
+                    blobs = self._retry(lambda: list(self.bucket.list_blobs(prefix=prefix)))
+                    self.remote = {blob.name: blob.md5_hash for blob in blobs}
+                except Exception as e:
+                    print(f"Warning: could not list {prefix} in the bucket, uploading without dedup: {e}")
+                    self.remote = {}
+        return self.remote.get(name)
+
+    def _retry(self, fn):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return fn()
+            except Exception:
+                if attempt == self.max_attempts:
+                    raise
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+                time.sleep(delay * random.uniform(0.5, 1.0))
+
+    def upload_one(self, folder, path):
+        """Upload one file unless it is already there; returns (path, status, error)"""
+        name = f"{folder}/{path}"
+        filename = os.path.join(folder, path)
+        try:
+            md5, uploaded = self.manifest.local_md5(name, filename)
+            if uploaded:
+                return path, "unchanged", None
+            if self.remote_md5(name, f"{folder}/") == md5:
+                self.manifest.record(name, filename, md5)
+                return path, "present", None
+            self._retry(lambda: self.bucket.blob(name).upload_from_filename(filename))
+            self.manifest.record(name, filename, md5)
+            return path, "uploaded", None
+        except Exception as e:
+            return path, "failed", str(e)
+
+    def upload_all(self, folder, paths):
+        """Yield (path, status, error) as uploads finish, with at most two per worker in flight"""
+        paths = iter(paths)
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                pending = {pool.submit(self.upload_one, folder, path)
+                           for _, path in zip(range(self.workers * 2), paths)}
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+                        nextPath = next(paths, None)
+                        if nextPath is not None:
+                            pending.add(pool.submit(self.upload_one, folder, nextPath))
+        finally:
+            self.manifest.save()
+
+
+def upload_folder(bucket, folder, paths, manifest_path=manifestFile, workers=8):
+    """Upload images and print a summary; returns the count per status"""
+    uploader = ImageUploader(bucket, UploadManifest(manifest_path), workers)
+    counts = {"uploaded": 0, "present": 0, "unchanged": 0, "failed": 0}
+    start = time.perf_counter()
+    for path, status, error in uploader.upload_all(folder, paths):
+        counts[status] += 1
+        if error:
+            print(f"Warning: upload of {path} failed: {error}")
+    elapsed = time.perf_counter() - start
+    print(f"Upload Complete: {counts['uploaded']} uploaded, {counts['present']} already in bucket, "
+          f"{counts['unchanged']} unchanged, {counts['failed']} failed in {elapsed:.1f}s")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upload student images to the storage bucket")
+    parser.add_argument('--images', default='Images')
+    parser.add_argument('--manifest', default=None, help=f"default: {manifestFile}, or a temporary file with --fake")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--fake', type=float, default=None, metavar='LATENCY',
+                        help="upload to an in-memory bucket with this per-upload latency instead")
+    args = parser.parse_args(argv)
+
+    manifest_path = args.manifest or manifestFile
+    if args.fake is not None:
+        import tempfile
+        from fakeFirebase import FakeBucket
+        bucket = FakeBucket(latency=args.fake)
+        # Never let a fake run mark files as uploaded in the real manifest
+        manifest_path = args.manifest or os.path.join(tempfile.mkdtemp(), manifestFile)
+    else:
+        from firebase_admin import storage
+        from encodeGenerator import init_firebase
+        init_firebase()
+        bucket = storage.bucket()
+    counts = upload_folder(bucket, args.images, list_image_paths(args.images), manifest_path, args.workers)
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from attendanceHistory import default_kiosk, safe_key
+
+
+def camera_cache_path(kiosk=None):
+    """Where a kiosk caches its camera index; one file per kiosk, so processes on one host keep their own"""
+    return f"camera_index.{safe_key(kiosk) if kiosk else default_kiosk()}.json"
+
+
+def load_camera_index(path, default=1):
+    """The camera index that worked last time, or default"""
+    try:
+        with open(path) as f:
+            return int(json.load(f)["index"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return default
+
+
+def save_camera_index(index, path):
+    """Remember a working camera index so the next start opens it first"""
+    if load_camera_index(path, default=None) == index:
+        return
+    try:
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({"index": int(index)}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Warning: could not cache camera index: {e}")
+
+
+def warm_up(detector, size=(120, 160)):
+    """Run every detector and the encoder once on a blank frame
+
+    The first real face would otherwise pay for dlib's and OpenCV's lazy
+    setup. The detectors are called directly, so the controller's latency
+    average is not skewed by the slow first call.
+    """
+    import face_recognition
+    rgb = np.full((size[0], size[1], 3), 128, dtype=np.uint8)
+    for face_detector in detector.detectors.values():
+        face_detector.detect(rgb)
+    face_recognition.face_encodings(rgb, [(size[0] // 4, size[1] * 3 // 4, size[0] * 3 // 4, size[1] // 4)])
+
+
+class StartupProfile:
+    """Wall-clock breakdown of startup; steps may overlap on different threads"""
+
+    def __init__(self, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self.steps = []
+        self.lock = threading.Lock()
+
+    def record(self, name, begin, end):
+        """Record a step timed elsewhere, with perf_counter() times"""
+        with self.lock:
+            self.steps.append((name, begin - self.start, end - begin, threading.current_thread().name))
+
+    @contextmanager
+    def step(self, name):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, begin, time.perf_counter())
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def report(self):
+        lines = ["Startup profile (start offset, duration, thread):"]
+        for name, offset, duration, thread in sorted(self.steps, key=lambda s: s[1]):
+            lines.append(f"  {name:<14} {offset * 1000:7.0f} ms  {duration * 1000:7.0f} ms  {thread}")
+        lines.append(f"  {'ready':<14} {self.elapsed() * 1000:7.0f} ms")
+        return "\n".join(lines)
+
+
+def run_parallel(tasks, profile=None):
+    """Run {name: fn} on one thread each; returns ({name: result}, {name: exception})
+
+    Every task runs to completion even if another fails, so the caller can
+    report all startup problems at once and release what did start.
+    """
+    profile = profile if profile is not None else StartupProfile()
+
+    def run(name, fn):
+        with profile.step(name):
+            return fn()
+
+    results, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="startup") as pool:
+        futures = {name: pool.submit(run, name, fn) for name, fn in tasks.items()}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                errors[name] = e
+    return results, errors
@@ -1,93 +1,131 @@
-import os
-import pickle
-import numpy as np
+import time
+# Taken before the other imports so --profile-startup includes them
+IMPORT_START = time.perf_counter()
 import cv2
-import face_recognition
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import db
-from firebase_admin import storage
 from datetime import datetime
 import tkinter as tk
-from tkinter import ttk
-from PIL import Image, ImageTk
-import threading
+from frameRenderer import FrameRenderer
 import sys
+import argparse
+from collections import deque
+from framePipeline import LatestQueue, PipelineStage, StageStats, format_stats
+from faceMatcher import AGGREGATIONS, INDEXES
+from recognitionEngine import init_firebase, create_engine, open_camera, open_student_cache, connect_matcher
+from faceDetectors import AdaptiveDetectionController
+from kioskStartup import StartupProfile, run_parallel, warm_up
+from galleryWatcher import GalleryWatcher, install_reload_signal, store_signature
+from encodingStore import DEFAULT_STORE_PATH
+from metrics import METRICS, start_metrics_server, install_profile_signal
 
 class FaceAttendanceSystem:
-    def __init__(self, root):
+    """Tk kiosk client: shows the camera feed and the results of a RecognitionEngine"""
+
+    def __init__(self, root, show_overlay=False, match_server=None, profile=None, report_startup=False,
+                 kiosk=None, wal_path=None, index="exact", nprobe=8, aggregation="min", live_templates=False):
         self.root = root
+        self.show_overlay = show_overlay
+        self.startup_profile = profile if profile is not None else StartupProfile()
+        self.report_startup = report_startup
         self.root.title("Facetendance")
         self.root.geometry("1200x700")
-        
-        # Initialize Firebase with error handling
-        try:
-            cred = credentials.Certificate("serviceAccountKey.json")
-            firebase_admin.initialize_app(cred, {
-                'databaseURL': "your_database_url",  # Replace with your actual database URL",
-                'storageBucket': "your_storage_bucket"  # Replace with your actual storage bucket
-            })
-            self.bucket = storage.bucket()
-            print("Firebase initialized successfully")
-        except Exception as e:
-            print(f"Error initializing Firebase: {e}")
+
+        # The slow parts of startup do not depend on each other, so they run
+        # side by side: Firebase credentials and the student prefetch, the
+        # gallery, the camera (last working index first) and the face models,
+        # which are loaded and warmed up on a blank frame
+        # Taken before the gallery loads, so an enrollment that lands meanwhile is applied on the first poll
+        signature = store_signature(DEFAULT_STORE_PATH)
+        with self.startup_profile.step("parallel init"):
+            results, errors = run_parallel({
+                "firebase": lambda: open_student_cache(init_firebase()),
+                "gallery": lambda: connect_matcher(aggregation=aggregation, match_server=match_server, index=index,
+                                                   nprobe=nprobe),
+                "camera": lambda: open_camera(kiosk=kiosk),
+                "models": self.load_models,
+            }, self.startup_profile)
+        self.cap, self.camera_index = results.get("camera", (None, None))
+        if errors or self.cap is None:
+            for name, e in errors.items():
+                print(f"Error during startup ({name}): {e}")
+            if self.cap is None:
+                print("Error: Could not open camera after multiple attempts")
+            else:
+                self.cap.release()
+            if "firebase" in results:
+                # Its database listener is not a daemon thread and would keep the process alive
+                results["firebase"].close()
             sys.exit(1)
-            
-        # Load the encoding file with error handling
+        print("Firebase initialized successfully")
+
+        # Build the recognition engine from the pieces loaded above
+        student_cache = results["firebase"]
         try:
-            print("Loading Encode File ...")
-            encode_file_path = 'EncodeFile.p'
-            if not os.path.exists(encode_file_path):
-                raise Exception(f"Encoding file not found: {encode_file_path}")
-                
-            file = open(encode_file_path, 'rb')
-            encodeListKnownWithIds = pickle.load(file)
-            file.close()
-            self.encodeListKnown, self.studentIds = encodeListKnownWithIds
-            if not self.encodeListKnown or not self.studentIds:
-                raise Exception("Encoding file exists but contains no data")
-            print("Encode File Loaded")
+            with self.startup_profile.step("engine"):
+                self.engine = create_engine(student_cache.db, aggregation=aggregation, live_templates=live_templates,
+                                            match_server=match_server, student_cache=student_cache,
+                                            matcher=results["gallery"], detector=results["models"],
+                                            kiosk=kiosk, wal_path=wal_path, index=index, nprobe=nprobe)
+                self.engine.camera = f"cam{self.camera_index}"
+                # Enrolling a student updates the running kiosk; SIGHUP forces a check.
+                # A match server watches the gallery itself.
+                if not match_server:
+                    self.gallery_watcher = GalleryWatcher(DEFAULT_STORE_PATH, [self.engine], loaded=signature).start()
+                    install_reload_signal(self.gallery_watcher)
         except Exception as e:
-            print(f"Error loading encode file: {e}")
-            sys.exit(1)
-            
-        # Set up camera with error handling
-        self.camera_index = 1  # Try 0 instead of 1 if camera is not found
-        max_camera_attempts = 3
-        camera_attempt = 0
-
-        while camera_attempt < max_camera_attempts:
-            self.cap = cv2.VideoCapture(self.camera_index)
-            if self.cap.isOpened():
-                self.cap.set(3, 640)
-                self.cap.set(4, 480)
-                print(f"Camera initialized successfully with index {self.camera_index}")
-                break
+            print(f"Error building recognition engine: {e}")
+            self.cap.release()
+            if hasattr(self, 'gallery_watcher'):
+                self.gallery_watcher.stop()
+            if hasattr(self, 'engine'):
+                self.engine.close()
             else:
-                camera_attempt += 1
-                self.camera_index = 0 if self.camera_index == 1 else 1  # Toggle between 0 and 1
-                print(f"Failed to open camera with index {self.camera_index}, trying alternative...")
-
-        if not self.cap.isOpened():
-            print("Error: Could not open camera after multiple attempts")
+                student_cache.close()
             sys.exit(1)
             
         # Initialize variables
-        self.mode_type = 0
-        self.counter = 0
+        # Marks waiting to be shown in the info panel, fed by the inference stage
+        self.recent_marks = deque(maxlen=50)
+        self.mark_history = deque(maxlen=5)
+        self.mark_shown_at = 0.0
         self.id = -1
         self.img_student = None
         self.student_info = None
         self.recognition_state = "Scanning"  # Initial state
         
         # Create UI elements
-        self.create_ui()
+        with self.startup_profile.step("ui"):
+            try:
+                self.create_ui()
+            except Exception:
+                self.on_closing()
+                raise
         
-        # Start camera thread
+        # Capture, recognition and rendering run as separate stages connected by
+        # single-slot queues, so the display keeps camera rate while recognition
+        # runs as fast as the CPU allows and never backs up
         self.running = True
-        self.thread = threading.Thread(target=self.update_camera)
-        self.thread.daemon = True
-        self.thread.start()
+        self.display_queue = LatestQueue()
+        self.inference_queue = LatestQueue()
+        self.latest_overlay = {"boxes": [], "loading": False}
+        self.capture_stage = PipelineStage("capture", self.capture_frame,
+                                           output_queues=[self.display_queue, self.inference_queue])
+        self.inference_stage = PipelineStage("inference", self.recognize_frame, input_queue=self.inference_queue)
+        self.render_stats = StageStats("render")
+        # Display buffers and the PhotoImage are allocated once and reused for every frame
+        self.renderer = FrameRenderer(500, 500)
+        self.capture_buffer = None
+        METRICS.gauge("frames_dropped", lambda: self.inference_queue.dropped)
+        self.last_stats_log = time.time()
+        self.capture_stage.start()
+        self.inference_stage.start()
+        self.root.after(0, self.render_frame)
+        self.root.after(0, self.show_next_mark)
+
+    def load_models(self):
+        """Build the face detectors (importing face_recognition loads the dlib models) and warm them up"""
+        detector = AdaptiveDetectionController(target_ms=60.0)
+        warm_up(detector)
+        return detector
         
     def create_ui(self):
         """Create the main user interface elements with green background design"""
@@ -160,177 +198,145 @@ class FaceAttendanceSystem:
                                       font=("Arial", 24, "bold"), bg="#4258B5", fg="#FFFFFF")
         self.status_indicator.place(x=180, y=350)
         
-    def update_camera(self):
-        """Update camera feed and process face recognition in a separate thread"""
-        while self.running:
-            success, img = self.cap.read()
-            
-            if not success:
-                print("Warning: Unable to read frame from camera, retrying...")
-                self.cap.release()
-                self.cap = cv2.VideoCapture(self.camera_index)
-                if not self.cap.isOpened():
-                    print("Error: Camera disconnected and can't be reinitialized")
-                    self.running = False
-                    break
-                continue
-                
-            # Resize image to match the target region dimensions
-            try:
-                img = cv2.resize(img, (500, 500))
-            except Exception as e:
-                print(f"Error resizing camera frame: {e}")
-                continue
-                
-            # Process image for face recognition
-            try:
-                imgS = cv2.resize(img, (0, 0), None, 0.25, 0.25)
-                imgS = cv2.cvtColor(imgS, cv2.COLOR_BGR2RGB)
-                face_cur_frame = face_recognition.face_locations(imgS)
-                encode_cur_frame = face_recognition.face_encodings(imgS, face_cur_frame)
-            except Exception as e:
-                print(f"Error processing face recognition: {e}")
-                face_cur_frame = []
-                encode_cur_frame = []
-                
-            # Draw faces on image
-            img_display = img.copy()
-            
-            if face_cur_frame:
-                for encodeFace, faceLoc in zip(encode_cur_frame, face_cur_frame):
-                    try:
-                        matches = face_recognition.compare_faces(self.encodeListKnown, encodeFace)
-                        faceDis = face_recognition.face_distance(self.encodeListKnown, encodeFace)
-                        
-                        if len(faceDis) > 0:  # Check if any faces were compared
-                            matchIndex = np.argmin(faceDis)
-                            
-                            if matchIndex < len(matches) and matches[matchIndex]:
-                                y1, x2, y2, x1 = faceLoc
-                                y1, x2, y2, x1 = y1 * 4, x2 * 4, y2 * 4, x1 * 4
-                                
-                                # Draw rectangle around face
-                                cv2.rectangle(img_display, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                                
-                                # Draw corner rectangles
-                                thickness = 2
-                                corner_len = 20
-                                # Top left
-                                cv2.line(img_display, (x1, y1), (x1 + corner_len, y1), (0, 255, 0), thickness)
-                                cv2.line(img_display, (x1, y1), (x1, y1 + corner_len), (0, 255, 0), thickness)
-                                # Top right
-                                cv2.line(img_display, (x2, y1), (x2 - corner_len, y1), (0, 255, 0), thickness)
-                                cv2.line(img_display, (x2, y1), (x2, y1 + corner_len), (0, 255, 0), thickness)
-                                # Bottom left
-                                cv2.line(img_display, (x1, y2), (x1 + corner_len, y2), (0, 255, 0), thickness)
-                                cv2.line(img_display, (x1, y2), (x1, y2 - corner_len), (0, 255, 0), thickness)
-                                # Bottom right
-                                cv2.line(img_display, (x2, y2), (x2 - corner_len, y2), (0, 255, 0), thickness)
-                                cv2.line(img_display, (x2, y2), (x2, y2 - corner_len), (0, 255, 0), thickness)
-                                
-                                if matchIndex < len(self.studentIds):
-                                    self.id = self.studentIds[matchIndex]
-                                    
-                                    if self.counter == 0:
-                                        # Show loading state
-                                        cv2.putText(img_display, "Loading", (50, 50), 
-                                                  cv2.FONT_HERSHEY_COMPLEX, 1, (0, 0, 255), 2)
-                                        self.counter = 1
-                                        self.mode_type = 1
-                                        # Set recognition state
-                                        self.recognition_state = "Processing"
-                                        self.root.after(0, self.update_status_display)
-                        
-                    except Exception as e:
-                        print(f"Error in face recognition matching: {e}")
-                
-                # Process face recognition results
-                if self.counter != 0:
-                    self.process_recognition()
-            else:
-                # If no faces detected and not in middle of processing
-                if self.mode_type != 1 and self.mode_type != 2:
-                    self.mode_type = 0
-                    self.counter = 0
-                    self.recognition_state = "Scanning"
-                    self.root.after(0, self.update_status_display)
-            
-            # Convert to format suitable for tkinter
-            img_display = cv2.cvtColor(img_display, cv2.COLOR_BGR2RGB)
-            img_tk = ImageTk.PhotoImage(image=Image.fromarray(img_display))
-            
-            # Update the UI with the camera feed
-            self.camera_label.config(image=img_tk)
-            self.camera_label.image = img_tk  # Keep a reference
+        # Most recent marks, so several students marked together are all acknowledged
+        self.recent_label = tk.Label(self.student_info_frame, text="", justify=tk.LEFT,
+                                  font=("Arial", 12), bg="#4258B5", fg="white")
+        self.recent_label.place(x=40, y=410)
+        
+    def capture_frame(self):
+        """Capture stage: read and resize one camera frame"""
+        with METRICS.time("capture"):
+            # Decode into the same buffer every time; the resize below makes the
+            # one per-frame copy that is handed to the other stages
+            success, img = self.cap.read(self.capture_buffer)
+            self.capture_buffer = img if success else None
+        
+        if not success:
+            print("Warning: Unable to read frame from camera, retrying...")
+            self.cap.release()
+            self.cap = cv2.VideoCapture(self.camera_index)
+            if not self.cap.isOpened():
+                print("Error: Camera disconnected and can't be reinitialized")
+                self.running = False
+                self.capture_stage.running = False
+            return None
             
-            # Process tkinter events to prevent freezing
-            self.root.update_idletasks()
-            self.root.after(10)  # Small delay to reduce CPU usage
+        # Resize image to match the target region dimensions
+        try:
+            with METRICS.time("resize"):
+                return cv2.resize(img, (500, 500))
+        except Exception as e:
+            print(f"Error resizing camera frame: {e}")
+            return None
+
+    def recognize_frame(self, img):
+        """Inference stage: hand the frame to the engine and queue its attendance events"""
+        result = self.engine.process_frame(img)
+        boxes = [d["box"] for d in result["detections"] if d["student_id"] is not None]
+        self.latest_overlay = {"boxes": boxes, "loading": result["loading"]}
+        self.recent_marks.extend(result["events"])
+        return self.latest_overlay
+
+    def draw_face_box(self, img_display, box):
+        """Draw a rectangle with corner accents around a recognized face (RGBA colors)"""
+        y1, x2, y2, x1 = box
+        cv2.rectangle(img_display, (x1, y1), (x2, y2), (0, 255, 0, 255), 2)
+        
+        # Draw corner rectangles
+        thickness = 2
+        corner_len = 20
+        # Top left
+        cv2.line(img_display, (x1, y1), (x1 + corner_len, y1), (0, 255, 0, 255), thickness)
+        cv2.line(img_display, (x1, y1), (x1, y1 + corner_len), (0, 255, 0, 255), thickness)
+        # Top right
+        cv2.line(img_display, (x2, y1), (x2 - corner_len, y1), (0, 255, 0, 255), thickness)
+        cv2.line(img_display, (x2, y1), (x2, y1 + corner_len), (0, 255, 0, 255), thickness)
+        # Bottom left
+        cv2.line(img_display, (x1, y2), (x1 + corner_len, y2), (0, 255, 0, 255), thickness)
+        cv2.line(img_display, (x1, y2), (x1, y2 - corner_len), (0, 255, 0, 255), thickness)
+        # Bottom right
+        cv2.line(img_display, (x2, y2), (x2 - corner_len, y2), (0, 255, 0, 255), thickness)
+        cv2.line(img_display, (x2, y2), (x2, y2 - corner_len), (0, 255, 0, 255), thickness)
+
+    def render_frame(self):
+        """Render stage: draw the latest recognition overlay on the newest frame.
+        Runs on the Tk main loop, so widgets are only touched from that thread."""
+        if not self.running:
+            return
+        img = self.display_queue.get_nowait()
+        if img is not None:
+            start = time.perf_counter()
+            # Convert once into the reused RGBA buffer and draw overlays there,
+            # leaving the captured frame untouched for the inference stage
+            with METRICS.time("tk_convert"):
+                self.renderer.render(img, self.draw_overlay)
+                img_tk = self.renderer.photo_image()
             
-    def process_recognition(self):
-        """Process the recognized face and update UI accordingly"""
-        if self.counter == 1:
-            # Get the Student Data with error handling
-            self.student_info = self.get_student_info(self.id)
-            if self.student_info is None:
-                # Handle missing student info
-                print(f"No data for student ID {self.id}, resetting")
-                self.counter = 0
-                self.mode_type = 0
-                self.recognition_state = "Scanning"
-                self.root.after(0, self.update_status_display)
-                return
+            # Update the UI with the camera feed; the PhotoImage is updated in place
+            if getattr(self.camera_label, "image", None) is not img_tk:
+                self.camera_label.config(image=img_tk)
+                self.camera_label.image = img_tk  # Keep a reference
+            self.render_stats.record(time.perf_counter() - start)
+            if self.report_startup:
+                # The kiosk is usable from the first frame on screen
+                self.report_startup = False
+                print(self.startup_profile.report())
 
-            # Update attendance with error handling
-            try:
-                if 'last_attendance_time' not in self.student_info:
-                    print(f"Warning: 'last_attendance_time' field missing for student ID {self.id}")
-                    self.student_info['last_attendance_time'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                
-                current_time = datetime.now()
-                current_time_str = current_time.strftime("%Y-%m-%d %H:%M:%S")
-                
-                datetimeObject = datetime.strptime(self.student_info['last_attendance_time'], 
-                                                 "%Y-%m-%d %H:%M:%S") if 'last_attendance_time' in self.student_info else None
-                
-                if datetimeObject is None or (current_time - datetimeObject).total_seconds() > 30:
-                    if 'total_attendance' not in self.student_info:
-                        print(f"Warning: 'total_attendance' field missing for student ID {self.id}")
-                        self.student_info['total_attendance'] = 0
-                        
-                    update_success = self.update_attendance(self.id, self.student_info)
-                    if not update_success:
-                        # Continue showing the student info even if update fails
-                        print("Continuing despite attendance update failure")
-                    
-                    # Show MARKED status
-                    self.recognition_state = "Marked"
-                    self.student_info['last_attendance_time'] = current_time_str
-                else:
-                    # Show ALREADY MARKED status
-                    self.recognition_state = "Already Marked"
-            except Exception as e:
-                print(f"Error processing attendance time: {e}")
-                # Reset to initial state when error occurs
-                self.counter = 0
-                self.mode_type = 0
-                self.recognition_state = "Scanning"
-                self.root.after(0, self.update_status_display)
-                return
-                
-            # Update UI to show student info
-            self.root.after(0, self.update_student_info)
-            self.root.after(0, self.update_status_display)
+        if time.time() - self.last_stats_log >= 30:
+            self.last_stats_log = time.time()
+            print(f"Pipeline: {format_stats(self.pipeline_stats())}")
+        self.root.after(5, self.render_frame)
 
-        self.counter += 1
+    def draw_overlay(self, img_display):
+        """Draw recognition results into the RGBA display buffer"""
+        overlay = self.latest_overlay
+        for box in overlay["boxes"]:
+            self.draw_face_box(img_display, box)
+        if overlay["loading"]:
+            cv2.putText(img_display, "Loading", (50, 50), cv2.FONT_HERSHEY_COMPLEX, 1, (255, 0, 0, 255), 2)
+        if self.show_overlay:
+            self.draw_metrics_overlay(img_display)
 
-        # Reset after 5 seconds (150 frames at 30fps)
-        if self.counter >= 150:
-            self.counter = 0
-            self.mode_type = 0
+    def draw_metrics_overlay(self, img):
+        """Draw display/recognition FPS and recognition latency in the corner of the frame"""
+        detect = METRICS.summary().get("face_locations", {})
+        p95 = detect.get("p95_ms")
+        lines = [f"display {self.render_stats.fps:.0f} fps",
+                 f"recognition {self.inference_stage.stats.fps:.0f} fps",
+                 f"detect p95 {p95:.0f} ms" if p95 is not None else "detect p95 -"]
+        for i, line in enumerate(lines):
+            cv2.putText(img, line, (10, 440 + i * 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255, 255), 1)
+
+    def pipeline_stats(self):
+        """Per-stage throughput counters"""
+        stats = [self.capture_stage.stats.snapshot(), self.inference_stage.stats.snapshot(),
+                 self.render_stats.snapshot()]
+        stats[0]["dropped_by_inference"] = self.inference_queue.dropped
+        stats[0]["dropped_by_render"] = self.display_queue.dropped
+        return stats
+            
+    def show_next_mark(self):
+        """Drive the info panel from the queue of recent marks (runs on the Tk main loop).
+        Each mark is shown for at least 1 second while others are waiting, and for
+        5 seconds when it is the last one."""
+        if not self.running:
+            return
+        now = time.time()
+        shown_for = now - self.mark_shown_at
+        if self.recent_marks and (self.recognition_state == "Scanning" or shown_for >= 1.0):
+            mark = self.recent_marks.popleft()
+            self.id = mark["student_id"]
+            self.student_info = mark["student_info"]
+            self.recognition_state = mark["state"]
+            self.mark_shown_at = now
+            self.mark_history.appendleft(mark)
+            self.update_student_info()
+            self.update_status_display()
+        elif self.recognition_state != "Scanning" and shown_for >= 5.0:
             self.student_info = None
             self.recognition_state = "Scanning"
-            self.root.after(0, self.update_status_display)
+            self.update_status_display()
+        self.root.after(100, self.show_next_mark)
     
     def update_status_display(self):
         """Update the display based on recognition state"""
@@ -377,45 +383,61 @@ class FaceAttendanceSystem:
             self.id_value.config(text=str(self.id))
             self.time_value.config(text=time_display)
             self.attendance_value.config(text=str(attendance))
-    
-    def get_student_info(self, student_id):
-        """Safely get student info from database"""
-        try:
-            student_info = db.reference(f'Students/{student_id}').get()
-            if student_info is None:
-                print(f"Warning: No data found for student ID: {student_id}")
-                return None
-            return student_info
-        except Exception as e:
-            print(f"Error retrieving student info from database: {e}")
-            return None
-    
-    def update_attendance(self, student_id, student_info):
-        """Safely update attendance in database"""
-        try:
-            ref = db.reference(f'Students/{student_id}')
-            student_info['total_attendance'] += 1
-            ref.child('total_attendance').set(student_info['total_attendance'])
-            ref.child('last_attendance_time').set(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-            print(f"Successfully updated attendance for student ID: {student_id}")
-            return True
-        except Exception as e:
-            print(f"Error updating attendance in database: {e}")
-            return False
+            
+            recent = [f"{m['student_info'].get('name', m['student_id'])}: {m['state']}" for m in self.mark_history]
+            self.recent_label.config(text="Recent:\n" + "\n".join(recent))
     
     def on_closing(self):
         """Clean up resources when closing the app"""
         self.running = False
-        if hasattr(self, 'thread') and self.thread.is_alive():
-            self.thread.join(timeout=1.0)
+        for stage in (getattr(self, 'capture_stage', None), getattr(self, 'inference_stage', None)):
+            if stage is not None:
+                stage.stop()
+                stage.join(timeout=1.0)
         if hasattr(self, 'cap') and self.cap.isOpened():
             self.cap.release()
+        if hasattr(self, 'gallery_watcher'):
+            self.gallery_watcher.stop()
+        if hasattr(self, 'engine'):
+            self.engine.close()
         self.root.destroy()
         print("Application closed successfully")
 
 def main():
-    root = tk.Tk()
-    app = FaceAttendanceSystem(root)
+    parser = argparse.ArgumentParser(description="Facetendance kiosk")
+    parser.add_argument('--metrics-port', type=int, default=9108, help="local metrics endpoint (0 to disable)")
+    parser.add_argument('--overlay', action='store_true', help="show FPS and latency on the camera feed")
+    parser.add_argument('--match-server', default=None,
+                        help="match on a shared matchServer.py at this address instead of loading the gallery")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="print where startup time went once the first frame is shown")
+    parser.add_argument('--aggregation', choices=AGGREGATIONS, default="min",
+                        help="how several templates of one student are scored")
+    parser.add_argument('--index', choices=INDEXES, default="exact",
+                        help="gallery index: exact, or approximate ivf for very large galleries (min aggregation)")
+    parser.add_argument('--nprobe', type=int, default=8, help="clusters scanned per query with --index ivf")
+    parser.add_argument('--live-templates', action='store_true',
+                        help="add confident live captures as extra templates")
+    parser.add_argument('--kiosk', default=None,
+                        help="kiosk name for the attendance log (default: host name); "
+                             "each kiosk process on a host needs its own")
+    parser.add_argument('--wal', default=None,
+                        help="local attendance write-ahead log (default: attendance_wal.<kiosk>.jsonl)")
+    args = parser.parse_args()
+    profile = StartupProfile(start=IMPORT_START)
+    profile.record("imports", IMPORT_START, time.perf_counter())
+
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    # SIGUSR1 starts the sampling profiler; a second SIGUSR1 writes profile-*.txt
+    install_profile_signal()
+
+    with profile.step("tk"):
+        root = tk.Tk()
+    app = FaceAttendanceSystem(root, show_overlay=args.overlay, match_server=args.match_server, profile=profile,
+                               report_startup=args.profile_startup, kiosk=args.kiosk, wal_path=args.wal,
+                               index=args.index, nprobe=args.nprobe, aggregation=args.aggregation,
+                               live_templates=args.live_templates)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
     root.mainloop()
 
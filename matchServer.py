@@ -0,0 +1,392 @@
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import struct
+import argparse
+import threading
+import socketserver
+import numpy as np
+from metrics import METRICS, start_metrics_server
+from encodingStore import ENCODING_DIM, DEFAULT_STORE_PATH
+from faceMatcher import AGGREGATIONS, INDEXES
+
+OP_MATCH = 1
+OP_TOP_K = 2
+OP_STATS = 3
+
+# Request: op, reserved, k, number of queries; followed by n x 128 little-endian float32
+REQUEST = struct.Struct('<BBHI')
+# Response: length of the JSON body that follows
+LENGTH = struct.Struct('<I')
+
+DEFAULT_ADDRESS = 'unix:/tmp/facetendance-match.sock' if hasattr(socket, 'AF_UNIX') else 'tcp:127.0.0.1:9110'
+
+
+def parse_address(address):
+    """'unix:/path', 'tcp:host:port', a socket path, or host:port -> (family, address)"""
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[5:]
+    if address.startswith('tcp:'):
+        address = address[4:]
+    elif '/' in address:
+        return socket.AF_UNIX, address
+    host, _, port = address.rpartition(':')
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+
+class _Request:
+    __slots__ = ("op", "queries", "k", "enqueued", "done", "response")
+
+    def __init__(self, op, queries, k):
+        self.op = op
+        self.queries = queries
+        self.k = k
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.response = None
+
+
+class MatchServer:
+    """Owns the gallery and matches encodings for many kiosks
+
+    Requests that arrive within window seconds of each other are stacked
+    into one matrix and matched in a single vectorized call, up to max_batch
+    queries per call. Every response carries its queue wait, the compute
+    time of its batch and the batch size. The server has the same
+    matcher/update_matcher interface as RecognitionEngine, so a
+    GalleryWatcher keeps it current.
+    """
+
+    def __init__(self, matcher, window=0.002, max_batch=256):
+        self.matcher = matcher
+        self.window = window
+        self.max_batch = max_batch
+        self.pending = []
+        self.cond = threading.Condition()
+        self.matcher_lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.queries = 0
+        self.running = False
+        self.thread = None
+
+    def update_matcher(self, update):
+        """Swap in update(current matcher); see RecognitionEngine.update_matcher"""
+        while True:
+            current = self.matcher
+            updated = update(current)
+            if updated is None:
+                return None
+            with self.matcher_lock:
+                if self.matcher is current:
+                    self.matcher = updated
+                    return updated
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="match-batcher", daemon=True)
+        self.thread.start()
+        return self
+
+    def submit(self, op, queries, k=1):
+        """Queue a request and wait for its batch; called from connection threads"""
+        request = _Request(op, queries, k)
+        with self.cond:
+            self.pending.append(request)
+            self.cond.notify()
+        request.done.wait()
+        return request.response
+
+    def _take_batch(self):
+        with self.cond:
+            while not self.pending and self.running:
+                self.cond.wait(0.5)
+            if not self.pending:
+                return []
+            # Give other kiosks one window to join the batch
+            deadline = self.pending[0].enqueued + self.window
+            while sum(len(r.queries) for r in self.pending) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            batch, count = [], 0
+            while self.pending and (not batch or count + len(self.pending[0].queries) <= self.max_batch):
+                request = self.pending.pop(0)
+                batch.append(request)
+                count += len(request.queries)
+            return batch
+
+    def _run(self):
+        while self.running:
+            batch = self._take_batch()
+            if batch:
+                self._process(batch)
+
+    def _process(self, batch):
+        matcher = self.matcher
+        start = time.perf_counter()
+        size = sum(len(r.queries) for r in batch)
+        try:
+            matches = [r for r in batch if r.op == OP_MATCH]
+            if matches:
+                results = matcher.match(np.concatenate([r.queries for r in matches]))
+                offset = 0
+                for r in matches:
+                    r.response = {"results": results[offset:offset + len(r.queries)]}
+                    offset += len(r.queries)
+
+            nearest = [r for r in batch if r.op == OP_TOP_K]
+            if nearest:
+                indices, dists = matcher.top_k(np.concatenate([r.queries for r in nearest]),
+                                               max(r.k for r in nearest))
+                offset = 0
+                for r in nearest:
+                    rows = slice(offset, offset + len(r.queries))
+                    # An ivf index pads rows it could not fill with -1 and inf
+                    r.response = {"ids": [[matcher.ids[i] if i >= 0 else None for i in row[:r.k]]
+                                          for row in indices[rows]],
+                                  "distances": dists[rows, :r.k].tolist()}
+                    offset += len(r.queries)
+        except Exception as e:
+            for r in batch:
+                r.response = {"error": str(e)}
+
+        compute = time.perf_counter() - start
+        METRICS.observe("match_server_compute", compute)
+        with self.cond:
+            self.requests += len(batch)
+            self.batches += 1
+            self.queries += size
+        for r in batch:
+            queue = start - r.enqueued
+            METRICS.observe("match_server_queue", queue)
+            r.response.update({"queue_ms": queue * 1000, "compute_ms": compute * 1000, "batch": size})
+            r.done.set()
+
+    def stats(self):
+        with self.cond:
+            batches = self.batches
+            stats = {"gallery": len(self.matcher), "requests": self.requests, "batches": batches,
+                     "avg_batch": self.queries / batches if batches else 0.0}
+        summary = METRICS.summary()
+        for stage in ("match_server_queue", "match_server_compute"):
+            if stage in summary:
+                stats[stage] = summary[stage]
+        return stats
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=2.0)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        owner = self.server.owner
+        while True:
+            header = self.rfile.read(REQUEST.size)
+            if len(header) < REQUEST.size:
+                return
+            op, _, k, n = REQUEST.unpack(header)
+            payload = self.rfile.read(n * ENCODING_DIM * 4)
+            if len(payload) < n * ENCODING_DIM * 4:
+                return
+            if op == OP_STATS:
+                response = owner.stats()
+            elif op in (OP_MATCH, OP_TOP_K):
+                queries = np.frombuffer(payload, dtype='<f4').reshape(n, ENCODING_DIM)
+                response = owner.submit(op, queries, k)
+            else:
+                response = {"error": f"unknown op {op}"}
+            body = json.dumps(response).encode('utf-8')
+            self.wfile.write(LENGTH.pack(len(body)) + body)
+            self.wfile.flush()
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+def serve(server, address=DEFAULT_ADDRESS):
+    """Listen on address on a background thread; returns the socketserver instance"""
+    family, addr = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(addr):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(addr)
+            except OSError:
+                os.remove(addr)  # left over from a previous run
+            else:
+                raise RuntimeError(f"another match server is already listening on {address}")
+            finally:
+                probe.close()
+        listener = _UnixServer(addr, _Handler)
+    else:
+        listener = _TCPServer(addr, _Handler)
+    listener.owner = server
+    threading.Thread(target=listener.serve_forever, name="match-server", daemon=True).start()
+    print(f"Match server listening on {address}")
+    return listener
+
+
+class MatchClient:
+    """Drop-in for FaceMatcher that matches on a MatchServer
+
+    match() returns the same (student_id or None, distance) pairs. top_k()
+    returns student ids instead of row indices, since the rows live on the
+    server. Each thread gets its own connection, so threads of one process
+    can land in the same server batch. last_latency holds the round trip,
+    queue wait, compute time and batch size of the last request.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=5.0):
+        self.address = address
+        self.family, self.addr = parse_address(address)
+        self.timeout = timeout
+        self.local = threading.local()
+        self.last_latency = None
+
+    def _connect(self):
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.addr)
+        if self.family != socket.AF_UNIX:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _request(self, op, encodings=None, k=0):
+        queries = np.zeros((0, ENCODING_DIM), dtype='<f4') if encodings is None else \
+            np.asarray(encodings, dtype='<f4').reshape(-1, ENCODING_DIM)
+        message = REQUEST.pack(op, 0, k, len(queries)) + queries.tobytes()
+        start = time.perf_counter()
+        for attempt in range(2):
+            sock = getattr(self.local, 'sock', None)
+            try:
+                if sock is None:
+                    sock = self.local.sock = self._connect()
+                sock.sendall(message)
+                (length,) = LENGTH.unpack(_recv_exact(sock, LENGTH.size))
+                response = json.loads(_recv_exact(sock, length))
+                break
+            except OSError:
+                # The server may have restarted; reconnect once before giving up
+                self.local.sock = None
+                if sock is not None:
+                    sock.close()
+                if attempt:
+                    raise
+        if "error" in response:
+            raise RuntimeError(f"match server: {response['error']}")
+        total = time.perf_counter() - start
+        METRICS.observe("match_remote", total)
+        if op != OP_STATS:
+            self.last_latency = {"total_ms": total * 1000, "queue_ms": response["queue_ms"],
+                                 "compute_ms": response["compute_ms"], "batch": response["batch"]}
+        return response
+
+    def match(self, encodings):
+        return [(student_id, distance) for student_id, distance in self._request(OP_MATCH, encodings)["results"]]
+
+    def top_k(self, encodings, k=1):
+        """(student ids, distances) of the k nearest gallery entries per query, nearest first
+
+        Rows an approximate index could not fill are padded with None and inf.
+        """
+        response = self._request(OP_TOP_K, encodings, k)
+        return response["ids"], np.asarray(response["distances"], dtype=np.float32)
+
+    def stats(self):
+        return self._request(OP_STATS)
+
+    def __len__(self):
+        return self.stats()["gallery"]
+
+    def close(self):
+        sock = getattr(self.local, 'sock', None)
+        if sock is not None:
+            sock.close()
+            self.local.sock = None
+
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("match server closed the connection")
+        data.extend(chunk)
+    return bytes(data)
+
+
+def main(argv=None):
+    from recognitionEngine import load_matcher
+    from galleryWatcher import GalleryWatcher, install_reload_signal, store_signature
+
+    parser = argparse.ArgumentParser(description="Serve gallery matching to kiosks on this machine")
+    parser.add_argument('--listen', default=DEFAULT_ADDRESS, help="unix:/path or tcp:host:port")
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH, help="gallery file")
+    parser.add_argument('--aggregation', choices=AGGREGATIONS, default="min")
+    parser.add_argument('--index', choices=INDEXES, default="exact",
+                        help="gallery index: exact, or approximate ivf for very large galleries (min aggregation)")
+    parser.add_argument('--nprobe', type=int, default=8, help="clusters scanned per query with --index ivf")
+    parser.add_argument('--window-ms', type=float, default=2.0, help="how long a batch waits for more requests")
+    parser.add_argument('--max-batch', type=int, default=256, help="most encodings matched in one call")
+    parser.add_argument('--reload-interval', type=float, default=2.0,
+                        help="seconds between checks of the gallery for changes (0: only on SIGHUP)")
+    parser.add_argument('--stats-interval', type=float, default=30.0)
+    parser.add_argument('--metrics-port', type=int, default=9109, help="local metrics endpoint (0 to disable)")
+    args = parser.parse_args(argv)
+
+    # Taken before loading, so an enrollment that lands during the load is applied on the first poll
+    signature = store_signature(args.store)
+    try:
+        matcher = load_matcher(args.store, args.aggregation, index=args.index, nprobe=args.nprobe)
+        server = MatchServer(matcher, args.window_ms / 1000, args.max_batch).start()
+        listener = serve(server, args.listen)
+    except Exception as e:
+        print(f"Error starting match server: {e}")
+        return 1
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    watcher = GalleryWatcher(args.store, [server], args.reload_interval, loaded=signature).start()
+    install_reload_signal(watcher)
+
+    running = [True]
+
+    def stop(signum, frame):
+        running[0] = False
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    last_log = time.time()
+    while running[0]:
+        time.sleep(0.2)
+        if time.time() - last_log >= args.stats_interval:
+            last_log = time.time()
+            print(f"Match server: {server.stats()}")
+
+    watcher.stop()
+    listener.shutdown()
+    listener.server_close()
+    server.stop()
+    family, addr = parse_address(args.listen)
+    if family == socket.AF_UNIX and os.path.exists(addr):
+        os.remove(addr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
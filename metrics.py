@@ -0,0 +1,246 @@
+import os
+import sys
+import time
+import signal
+import threading
+from bisect import bisect_left
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Latency bucket upper bounds in seconds, roughly exponential from 0.1 ms to 5 s
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram; observing is a bisect and two additions"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        """Approximate quantile: the upper bound of the bucket holding it"""
+        with self.lock:
+            counts, total = list(self.counts), self.count
+        if total == 0:
+            return None
+        rank = q * total
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class MetricsRegistry:
+    """Stage latency histograms, counters and gauges, rendered as Prometheus text"""
+
+    def __init__(self, prefix='facetendance'):
+        self.prefix = prefix
+        self.stages = {}
+        self.counters = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def stage(self, name):
+        histogram = self.stages.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.stages.setdefault(name, Histogram())
+        return histogram
+
+    def observe(self, name, seconds):
+        self.stage(name).observe(seconds)
+
+    @contextmanager
+    def time(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage(name).observe(time.perf_counter() - start)
+
+    def inc(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name, fn):
+        """Register a callable evaluated at scrape time"""
+        self.gauges[name] = fn
+
+    def summary(self):
+        """Per-stage count and approximate p50/p95 in milliseconds"""
+        result = {}
+        for name, histogram in sorted(self.stages.items()):
+            p50, p95 = histogram.quantile(0.5), histogram.quantile(0.95)
+            result[name] = {"count": histogram.count,
+                            "p50_ms": None if p50 is None else p50 * 1000,
+                            "p95_ms": None if p95 is None else p95 * 1000}
+        return result
+
+    def render_prometheus(self):
+        p = self.prefix
+        lines = [f"# HELP {p}_stage_seconds Time spent in each stage of the recognition loop",
+                 f"# TYPE {p}_stage_seconds histogram"]
+        for name, histogram in sorted(self.stages.items()):
+            with histogram.lock:
+                counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{p}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{p}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {count}')
+            lines.append(f'{p}_stage_seconds_sum{{stage="{name}"}} {total}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{name}"}} {count}')
+
+        with self.lock:
+            counters = dict(self.counters)
+        for name, value in sorted(counters.items()):
+            lines.append(f"# TYPE {p}_{name}_total counter")
+            lines.append(f"{p}_{name}_total {value}")
+        for name, fn in sorted(self.gauges.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            lines.append(f"# TYPE {p}_{name} gauge")
+            lines.append(f"{p}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared registry; modules record into it without having to pass it around
+METRICS = MetricsRegistry()
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads at a fixed interval
+
+    Unlike cProfile this sees every thread (capture, inference, Tk) and costs
+    nothing while stopped. Output is in collapsed-stack format, one
+    "frame;frame;frame count" line per stack, ready for flamegraph tools.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = _Tally()
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        if self.running:
+            return False
+        self.samples = _Tally()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+        return True
+
+    def _run(self):
+        own = threading.get_ident()
+        while self.running:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        return self.collapsed()
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def profile(self, seconds):
+        """Sample for a number of seconds and return the collapsed stacks"""
+        if not self.start():
+            return "# profiler already running\n"
+        time.sleep(seconds)
+        return self.stop()
+
+
+PROFILER = SamplingProfiler()
+
+
+def install_profile_signal(signum=getattr(signal, 'SIGUSR1', None), directory='.'):
+    """Toggle the sampling profiler with a signal; the second signal dumps the profile"""
+    if signum is None:
+        return
+
+    def toggle(received, frame):
+        if PROFILER.running:
+            path = os.path.join(directory, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.txt")
+            with open(path, 'w') as f:
+                f.write(PROFILER.stop())
+            print(f"Profile written to {path}")
+        else:
+            PROFILER.start()
+            print("Sampling profiler started; send the signal again to dump")
+
+    signal.signal(signum, toggle)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = METRICS
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/metrics':
+            body = self.registry.render_prometheus()
+            content_type = 'text/plain; version=0.0.4'
+        elif url.path == '/profile':
+            seconds = float(parse_qs(url.query).get('seconds', ['10'])[0])
+            body = PROFILER.profile(min(seconds, 120.0))
+            content_type = 'text/plain'
+        else:
+            self.send_error(404)
+            return
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # keep scrapes out of the kiosk log
+
+
+def start_metrics_server(port=9108, host='127.0.0.1', registry=METRICS):
+    """Serve /metrics (Prometheus text) and /profile?seconds=N on a background thread
+
+    Returns None, with a warning, when the port is taken (e.g. by another
+    kiosk process on the same host); the caller carries on without metrics.
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {"registry": registry})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        print(f"Warning: metrics endpoint disabled, cannot listen on {host}:{port}: {e} "
+              f"(use --metrics-port to pick another port)")
+        return None
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    print(f"Metrics available at http://{host}:{port}/metrics")
+    return server
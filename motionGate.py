@@ -0,0 +1,98 @@
+import time
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Skips face detection while the scene in front of the kiosk is static
+
+    Each frame is reduced to a tiny grayscale thumbnail and compared with a
+    slowly updated background. While there is motion, or faces were seen in
+    the last idle_after seconds, every frame is detected. Otherwise the gate
+    goes idle and lets one frame through every idle_interval seconds, which
+    still catches someone standing perfectly still. The first frame with
+    motion is detected, so the kiosk is back at full rate within one frame.
+    """
+
+    def __init__(self, thumb_size=(32, 24), threshold=15.0, min_changed=0.02, learning_rate=0.05,
+                 idle_after=3.0, idle_interval=1.0):
+        self.thumb_size = thumb_size
+        self.threshold = threshold
+        self.min_changed = min_changed
+        self.learning_rate = learning_rate
+        self.idle_after = idle_after
+        self.idle_interval = idle_interval
+        self.background = None
+        self.last_activity = None
+        self.last_detect = float('-inf')
+        self.idle = False
+        self.last_update = None
+        self.active_seconds = 0.0
+        self.idle_seconds = 0.0
+        self.detected = 0
+        self.skipped = 0
+        self.detect_seconds = 0.0
+
+    def copy(self):
+        """A gate with the same settings and no state, e.g. for another camera"""
+        return MotionGate(self.thumb_size, self.threshold, self.min_changed, self.learning_rate,
+                          self.idle_after, self.idle_interval)
+
+    def motion(self, img_bgr):
+        """Fraction of thumbnail pixels that differ from the background"""
+        thumb = cv2.resize(img_bgr, self.thumb_size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY).astype(np.float32)
+        if self.background is None:
+            self.background = gray
+            return 1.0
+        changed = float(np.count_nonzero(cv2.absdiff(gray, self.background) > self.threshold)) / gray.size
+        # Lighting drifts into the background; people moving are too brief to be absorbed
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+        return changed
+
+    def update(self, img_bgr, now=None):
+        """Return True if detection should run on this frame"""
+        now = time.monotonic() if now is None else now
+        if self.last_update is not None:
+            elapsed = now - self.last_update
+            if self.idle:
+                self.idle_seconds += elapsed
+            else:
+                self.active_seconds += elapsed
+        self.last_update = now
+
+        if self.motion(img_bgr) >= self.min_changed:
+            self.last_activity = now
+        if self.last_activity is None:
+            self.last_activity = now
+
+        idle = now - self.last_activity >= self.idle_after
+        if idle != self.idle:
+            self.idle = idle
+            if idle:
+                print(f"Motion gate: idle, detecting every {self.idle_interval:.1f}s")
+            else:
+                print("Motion gate: active")
+
+        if idle and now - self.last_detect < self.idle_interval:
+            self.skipped += 1
+            return False
+        self.last_detect = now
+        return True
+
+    def report(self, faces, detect_seconds, now=None):
+        """Record the outcome of a detection the gate let through; faces keep it active"""
+        self.detected += 1
+        self.detect_seconds += detect_seconds
+        if faces:
+            self.last_activity = time.monotonic() if now is None else now
+            if self.idle:
+                self.idle = False
+                print("Motion gate: active")
+
+    def stats(self):
+        """Idle/active time and the detection time saved by skipped frames"""
+        average = self.detect_seconds / self.detected if self.detected else 0.0
+        return {"state": "idle" if self.idle else "active", "active_s": round(self.active_seconds, 1),
+                "idle_s": round(self.idle_seconds, 1), "detected": self.detected, "skipped": self.skipped,
+                "cpu_saved_s": round(self.skipped * average, 1)}
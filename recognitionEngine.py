@@ -0,0 +1,509 @@
+import os
+import sys
+import time
+import signal
+import threading
+import argparse
+from datetime import datetime
+import cv2
+from faceMatcher import build_matcher, LiveTemplatePolicy, AGGREGATIONS, INDEXES
+from faceTracker import FaceTracker
+from faceDetectors import AdaptiveDetectionController
+from faceQuality import FaceQualityGate
+from motionGate import MotionGate
+from attendanceSink import AttendanceSink, FirebaseAttendanceBackend
+from attendanceHistory import AttendanceHistory
+from studentCache import StudentCache
+from framePipeline import LatestQueue, PipelineStage, format_stats
+from metrics import METRICS, start_metrics_server, install_profile_signal
+from encodingStore import load_gallery, DEFAULT_STORE_PATH, MODEL_VERSION
+from galleryWatcher import GalleryWatcher, install_reload_signal, store_signature
+from kioskStartup import camera_cache_path, load_camera_index, save_camera_index
+
+FIREBASE_CONFIG = {
+    'databaseURL': "your_database_url",  # Replace with your actual database URL
+    'storageBucket': "your_storage_bucket"  # Replace with your actual storage bucket
+}
+
+
+def init_firebase(credentials_path="serviceAccountKey.json", config=FIREBASE_CONFIG):
+    """Initialize the default Firebase app and return the firebase_admin.db module"""
+    import firebase_admin
+    from firebase_admin import credentials
+    from firebase_admin import db
+
+    cred = credentials.Certificate(credentials_path)
+    firebase_admin.initialize_app(cred, config)
+    return db
+
+
+def load_matcher(encode_file_path=DEFAULT_STORE_PATH, aggregation="min", k=3, index="exact", nprobe=8):
+    """Load the gallery file into a matcher, raising if it is missing or empty
+
+    index="ivf" builds the approximate IVFFaceMatcher, scanning nprobe
+    clusters per query.
+    """
+    if not os.path.exists(encode_file_path):
+        if os.path.exists('EncodeFile.p'):
+            raise Exception(f"Encoding file not found: {encode_file_path} "
+                            "(run 'python encodingStore.py convert' to convert EncodeFile.p)")
+        raise Exception(f"Encoding file not found: {encode_file_path}")
+
+    # The encodings are memory-mapped, so startup does not depend on gallery size
+    gallery = load_gallery(encode_file_path, model_version=MODEL_VERSION)
+    if len(gallery.encodings) == 0 or not gallery.ids:
+        raise Exception("Encoding file exists but contains no data")
+    # Keep the gallery as one float32 matrix so a frame is matched in a single pass;
+    # students with several templates are scored with the chosen aggregation
+    return build_matcher(gallery.encodings, gallery.ids, index=index, aggregation=aggregation, k=k, nprobe=nprobe)
+
+
+def open_camera(camera_index=None, max_camera_attempts=3, kiosk=None):
+    """Open a camera, toggling between indices 0 and 1; returns (cap, index) or (None, index)
+
+    Without an index, the one that worked last time for this kiosk is tried first.
+    """
+    cache_path = camera_cache_path(kiosk)
+    if camera_index is None:
+        camera_index = load_camera_index(cache_path)
+    camera_attempt = 0
+    while camera_attempt < max_camera_attempts:
+        cap = cv2.VideoCapture(camera_index)
+        if cap.isOpened():
+            cap.set(3, 640)
+            cap.set(4, 480)
+            print(f"Camera initialized successfully with index {camera_index}")
+            save_camera_index(camera_index, cache_path)
+            return cap, camera_index
+        camera_attempt += 1
+        cap.release()
+        camera_index = 0 if camera_index == 1 else 1  # Toggle between 0 and 1
+        print(f"Failed to open camera, trying alternative index {camera_index}...")
+    return None, camera_index
+
+
+class RecognitionEngine:
+    """UI-free recognition: takes BGR frames and returns detections and attendance events
+
+    The engine owns detection, tracking, matching and attendance marking,
+    but no window, camera or Firebase app, so it can run headless, be
+    benchmarked, or be driven by the Tk client in main.py.
+    """
+
+    def __init__(self, matcher, student_cache, attendance_sink, detector=None, tracker=None,
+                 cooldown=5.0, duplicate_window=30.0, mark_lock=None, quality_gate=None, template_policy=None,
+                 motion_gate=None, peers=None, matcher_lock=None):
+        # Imported here rather than at module level: it loads the dlib models,
+        # and kiosk startup overlaps that with other work (kioskStartup.py)
+        import face_recognition
+        self.face_encodings = face_recognition.face_encodings
+        self.matcher = matcher
+        self.student_cache = student_cache
+        self.attendance_sink = attendance_sink
+        # Detector and downscale factor are chosen per frame to stay within the latency budget
+        self.detector = detector if detector is not None else AdaptiveDetectionController(target_ms=60.0)
+        # Encoding and matching only run for new or stale tracks
+        self.tracker = tracker if tracker is not None else FaceTracker()
+        # Blurry, tiny, badly lit or turned-away faces are not worth an encoding
+        self.quality_gate = quality_gate if quality_gate is not None else FaceQualityGate()
+        # Optional: skip detection on static frames (MotionGate)
+        self.motion_gate = motion_gate
+        # Optional: confident live captures become extra templates (LiveTemplatePolicy)
+        self.template_policy = template_policy
+        self.cooldown = cooldown
+        self.duplicate_window = duplicate_window
+        # Recognition state is kept per student, so every face in view is marked in the same pass
+        self.identity_states = {}
+        # Engines sharing a student cache share this lock, so the duplicate check
+        # and the mark it guards happen as one step across cameras
+        self.mark_lock = mark_lock if mark_lock is not None else threading.Lock()
+        # Engines for other cameras (camera_engine) share the matcher: every swap is applied
+        # to all of them under one lock, so the gallery is held in memory once
+        self.matcher_lock = matcher_lock if matcher_lock is not None else threading.Lock()
+        self.peers = peers if peers is not None else []
+        self.peers.append(self)
+        # Recorded with every attendance event; set by whoever owns the camera
+        self.camera = None
+        self.frames = 0
+        self.events = 0
+
+    def process_frame(self, img, now=None):
+        """Run recognition on one BGR frame
+
+        Returns a dict with "detections" (box in frame coordinates, track id,
+        student id or None, distance), "events" (attendance results for
+        students recognized in this frame) and "loading" (True when any
+        student was newly processed).
+        """
+        now = time.time() if now is None else now
+        self.frames += 1
+        METRICS.inc("frames")
+        if self.motion_gate is not None and not self.motion_gate.update(img, now):
+            # Nothing moved and nobody was seen lately; tracks are left as they are
+            METRICS.inc("frames_idle")
+            return {"detections": [], "events": [], "loading": False, "idle": True}
+
+        start = time.perf_counter()
+        try:
+            with METRICS.time("face_locations"):
+                face_cur_frame, imgS, scale = self.detector.detect(img)
+        except Exception as e:
+            print(f"Error processing face recognition: {e}")
+            face_cur_frame, imgS, scale = [], None, 1.0
+        if self.motion_gate is not None:
+            self.motion_gate.report(len(face_cur_frame), time.perf_counter() - start, now)
+
+        # Track in full-frame coordinates so tracks survive detector scale changes
+        face_full_frame = [tuple(int(v / scale) for v in faceLoc) for faceLoc in face_cur_frame]
+        tracks = self.tracker.update(face_full_frame)
+        METRICS.inc("faces_seen", len(tracks))
+
+        # Only faces on new or stale tracks pay for the 128-d encoding and gallery match
+        pending = [i for i, track in enumerate(tracks) if self.tracker.needs_encoding(track)]
+        if pending:
+            # Rejected faces stay pending, so the track is retried on a better frame
+            with METRICS.time("quality"):
+                accepted, rejected = self.quality_gate.filter(imgS, [face_cur_frame[i] for i in pending], scale)
+            for reason, count in rejected.items():
+                METRICS.inc(f"faces_rejected_{reason}", count)
+            pending = [pending[i] for i in accepted]
+        if pending:
+            try:
+                with METRICS.time("face_encodings"):
+                    encode_cur_frame = self.face_encodings(imgS, [face_cur_frame[i] for i in pending])
+                with METRICS.time("match"):
+                    matches = self.matcher.match(encode_cur_frame)
+                for i, encoding, (student_id, distance) in zip(pending, encode_cur_frame, matches):
+                    self.tracker.add_match(tracks[i], student_id, distance)
+                    if self.template_policy is not None and student_id is not None \
+                            and tracks[i].identity == student_id:
+                        self.add_template(student_id, encoding, distance, now)
+            except Exception as e:
+                print(f"Error in face recognition matching: {e}")
+
+        detections = []
+        events = []
+        for faceLoc, track in zip(face_full_frame, tracks):
+            detections.append({"box": faceLoc, "track_id": track.track_id,
+                               "student_id": track.identity, "distance": track.distance})
+            # Identities are voted over several frames before anything is marked
+            if track.identity is None:
+                continue
+            state = self.identity_states.get(track.identity)
+            if state is None or state["expires"] <= now:
+                with METRICS.time("process_recognition"), self.mark_lock:
+                    event = self.process_recognition(track.identity, now, track.distance)
+                if event is not None:
+                    event["distance"] = track.distance
+                    events.append(event)
+
+        # Forget students whose cooldown has passed
+        for student_id in [sid for sid, state in self.identity_states.items() if state["expires"] <= now]:
+            del self.identity_states[student_id]
+        self.events += len(events)
+        return {"detections": detections, "events": events, "loading": bool(events), "idle": False}
+
+    def process_recognition(self, student_id, now, distance=None):
+        """Mark one recognized student; returns the attendance event or None"""
+        # Whatever the outcome, leave this student alone until the cooldown passes
+        self.identity_states[student_id] = {"state": "Processing", "expires": now + self.cooldown}
+
+        # Get the Student Data with error handling
+        student_info = self.get_student_info(student_id)
+        if student_info is None:
+            # Handle missing student info
+            print(f"No data for student ID {student_id}, skipping")
+            self.identity_states[student_id]["state"] = "Unknown"
+            return None
+
+        # Update attendance with error handling
+        try:
+            if 'last_attendance_time' not in student_info:
+                print(f"Warning: 'last_attendance_time' field missing for student ID {student_id}")
+                student_info['last_attendance_time'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+            current_time = datetime.now()
+            current_time_str = current_time.strftime("%Y-%m-%d %H:%M:%S")
+
+            datetimeObject = datetime.strptime(student_info['last_attendance_time'],
+                                             "%Y-%m-%d %H:%M:%S") if 'last_attendance_time' in student_info else None
+
+            if datetimeObject is None or (current_time - datetimeObject).total_seconds() > self.duplicate_window:
+                if 'total_attendance' not in student_info:
+                    print(f"Warning: 'total_attendance' field missing for student ID {student_id}")
+                    student_info['total_attendance'] = 0
+
+                update_success = self.update_attendance(student_id, student_info, distance)
+                if not update_success:
+                    # Continue showing the student info even if update fails
+                    print("Continuing despite attendance update failure")
+
+                state = "Marked"
+                student_info['last_attendance_time'] = current_time_str
+            else:
+                state = "Already Marked"
+        except Exception as e:
+            print(f"Error processing attendance time: {e}")
+            self.identity_states[student_id]["state"] = "Error"
+            return None
+
+        self.identity_states[student_id]["state"] = state
+        return {"student_id": student_id, "student_info": student_info, "state": state,
+                "time": current_time_str}
+
+    def get_student_info(self, student_id):
+        """Safely get student info from the cache, falling back to the database"""
+        try:
+            student_info = self.student_cache.get(student_id)
+            if student_info is None:
+                print(f"Warning: No data found for student ID: {student_id}")
+                return None
+            return student_info
+        except Exception as e:
+            print(f"Error retrieving student info from database: {e}")
+            return None
+
+    def update_attendance(self, student_id, student_info, distance=None):
+        """Queue an attendance mark; the sink writes it to the database in the background"""
+        try:
+            student_info['total_attendance'] += 1
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.attendance_sink.mark(student_id, timestamp, distance, self.camera)
+            # Keep the cached record current so the duplicate check sees this mark
+            self.student_cache.record_mark(student_id, timestamp)
+            print(f"Queued attendance update for student ID: {student_id}")
+            return True
+        except Exception as e:
+            print(f"Error queueing attendance update: {e}")
+            return False
+
+    def update_matcher(self, update):
+        """Replace the matcher with update(current matcher), unless it returns None
+
+        Readers never lock: a frame keeps using the matcher it started with.
+        The update is built outside the lock and retried if another update
+        (a live template, a gallery reload) swapped the matcher meanwhile.
+        The new matcher replaces the current one in every peer engine.
+        """
+        while True:
+            current = self.matcher
+            updated = update(current)
+            if updated is None:
+                return None
+            with self.matcher_lock:
+                if self.matcher is current:
+                    for engine in self.peers:
+                        if engine.matcher is current:
+                            engine.matcher = updated
+                    return updated
+
+    def add_template(self, student_id, encoding, distance, now):
+        """Offer a confirmed live capture to the template policy"""
+        updated = self.update_matcher(
+            lambda matcher: self.template_policy.consider(matcher, student_id, encoding, distance, now))
+        if updated is not None:
+            METRICS.inc("templates_added")
+            print(f"Added live template for student {student_id} "
+                  f"({len(updated.templates(student_id))} templates)")
+
+    def camera_engine(self):
+        """A new engine for another camera: its own detector and tracker, but the
+        same gallery (one shared matcher), student cache and attendance sink as this one"""
+        return RecognitionEngine(self.matcher, self.student_cache, self.attendance_sink,
+                                 detector=AdaptiveDetectionController(
+                                     target_ms=getattr(self.detector, "target_ms", 60.0)),
+                                 cooldown=self.cooldown, duplicate_window=self.duplicate_window,
+                                 mark_lock=self.mark_lock, quality_gate=self.quality_gate,
+                                 template_policy=self.template_policy,
+                                 motion_gate=self.motion_gate.copy() if self.motion_gate is not None else None,
+                                 peers=self.peers, matcher_lock=self.matcher_lock)
+
+    def stats(self):
+        return {"frames": self.frames, "events": self.events, "tracks": len(self.tracker.tracks),
+                "detector": self.detector.last_mode, "quality": self.quality_gate.stats(),
+                "motion": self.motion_gate.stats() if self.motion_gate is not None else None,
+                "cache": self.student_cache.stats(), "sink": self.attendance_sink.stats()}
+
+    def close(self):
+        self.attendance_sink.close()
+        self.student_cache.close()
+
+
+def open_student_cache(db):
+    """Prefetch all student records so recognitions are served from memory"""
+    student_cache = StudentCache(db)
+    try:
+        count = student_cache.prefetch()
+        print(f"Student cache loaded with {count} records ({student_cache.start_refresh()} refresh)")
+    except Exception as e:
+        print(f"Warning: student cache prefetch failed, reading records on demand: {e}")
+    return student_cache
+
+
+def connect_matcher(encode_file_path=DEFAULT_STORE_PATH, aggregation="min", match_server=None, index="exact",
+                    nprobe=8):
+    """Load the gallery, or connect to the matchServer.py at match_server"""
+    if match_server:
+        from matchServer import MatchClient
+        matcher = MatchClient(match_server)
+        print(f"Matching on {match_server} ({len(matcher)} encodings)")
+        return matcher
+    return load_matcher(encode_file_path, aggregation, index=index, nprobe=nprobe)
+
+
+def create_engine(db, encode_file_path=DEFAULT_STORE_PATH, target_ms=60.0, aggregation="min",
+                  live_templates=False, motion_gate=True, match_server=None, student_cache=None, matcher=None,
+                  detector=None, kiosk=None, wal_path=None, index="exact", nprobe=8):
+    """Build an engine wired to a Firebase-style db (firebase_admin.db or fakeFirebase.FakeDb)
+
+    With match_server (an address of matchServer.py) the gallery stays on
+    the server and this engine only sends encodings. A student cache,
+    matcher or detector built beforehand (e.g. in parallel at startup) is
+    used as is. kiosk names this process in the attendance log and its
+    local write-ahead log (wal_path, by default one file per kiosk).
+    """
+    # Attendance writes are queued and flushed in the background, so the
+    # recognition loop never waits on the database
+    # Every mark is also logged by date and kiosk and mirrored locally for reports
+    attendance_sink = AttendanceSink(FirebaseAttendanceBackend(db), wal_path, history=AttendanceHistory(),
+                                     kiosk=kiosk)
+    owns_cache = student_cache is None
+    try:
+        if student_cache is None:
+            student_cache = open_student_cache(db)
+        if matcher is None:
+            matcher = connect_matcher(encode_file_path, aggregation, match_server, index, nprobe)
+        if match_server and live_templates:
+            print("Warning: live templates are not available with a match server")
+            live_templates = False
+        if index == "ivf" and live_templates:
+            print("Warning: live templates are not available with the ivf index")
+            live_templates = False
+
+        return RecognitionEngine(matcher, student_cache, attendance_sink,
+                                 detector=detector if detector is not None
+                                 else AdaptiveDetectionController(target_ms=target_ms),
+                                 template_policy=LiveTemplatePolicy() if live_templates else None,
+                                 motion_gate=MotionGate() if motion_gate else None)
+    except Exception:
+        # The cache's database listener is not a daemon thread and would keep the process alive
+        attendance_sink.close()
+        if owns_cache and student_cache is not None:
+            student_cache.close()
+        raise
+
+
+def run_headless(engine, cap, camera_index, stats_interval=30.0):
+    """Capture and recognize until interrupted, printing attendance events"""
+    running = [True]
+
+    def capture_frame():
+        with METRICS.time("capture"):
+            success, img = cap.read()
+        if not success:
+            print("Warning: Unable to read frame from camera")
+            time.sleep(0.1)
+            return None
+        return img
+
+    def recognize_frame(img):
+        result = engine.process_frame(img)
+        for event in result["events"]:
+            name = event["student_info"].get('name', 'Unknown')
+            print(f"{event['time']} {event['student_id']} {name}: {event['state']}")
+        return result
+
+    inference_queue = LatestQueue()
+    METRICS.gauge("frames_dropped", lambda: inference_queue.dropped)
+    capture_stage = PipelineStage("capture", capture_frame, output_queues=[inference_queue])
+    inference_stage = PipelineStage("inference", recognize_frame, input_queue=inference_queue)
+
+    def stop(signum, frame):
+        running[0] = False
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    capture_stage.start()
+    inference_stage.start()
+    print(f"Headless recognition running on camera {camera_index}, Ctrl+C to stop")
+    last_log = time.time()
+    while running[0]:
+        time.sleep(0.2)
+        if time.time() - last_log >= stats_interval:
+            last_log = time.time()
+            stats = [capture_stage.stats.snapshot(), inference_stage.stats.snapshot()]
+            print(f"Pipeline: {format_stats(stats)}; engine: {engine.stats()}")
+
+    for stage in (capture_stage, inference_stage):
+        stage.stop()
+        stage.join(timeout=1.0)
+    cap.release()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run face recognition attendance without a UI")
+    parser.add_argument('--camera', type=int, default=None,
+                        help="camera index (default: the last one that worked; falls back to the other of 0/1)")
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH, help="gallery file")
+    parser.add_argument('--target-ms', type=float, default=60.0, help="detection latency budget")
+    parser.add_argument('--aggregation', choices=AGGREGATIONS, default="min",
+                        help="how several templates of one student are scored")
+    parser.add_argument('--index', choices=INDEXES, default="exact",
+                        help="gallery index: exact, or approximate ivf for very large galleries (min aggregation)")
+    parser.add_argument('--nprobe', type=int, default=8, help="clusters scanned per query with --index ivf")
+    parser.add_argument('--live-templates', action='store_true',
+                        help="add confident live captures as extra templates")
+    parser.add_argument('--no-motion-gate', action='store_true',
+                        help="run detection on every frame, even when the scene is static")
+    parser.add_argument('--match-server', default=None,
+                        help="match on a shared matchServer.py at this address instead of loading the gallery")
+    parser.add_argument('--reload-interval', type=float, default=2.0,
+                        help="seconds between checks of the gallery for changes (0: only on SIGHUP)")
+    parser.add_argument('--kiosk', default=None,
+                        help="kiosk name for the attendance log (default: host name); "
+                             "each kiosk process on a host needs its own")
+    parser.add_argument('--wal', default=None,
+                        help="local attendance write-ahead log (default: attendance_wal.<kiosk>.jsonl)")
+    parser.add_argument('--stats-interval', type=float, default=30.0)
+    parser.add_argument('--metrics-port', type=int, default=9108, help="local metrics endpoint (0 to disable)")
+    args = parser.parse_args(argv)
+
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    install_profile_signal()
+
+    # Taken before loading, so an enrollment that lands during the load is applied on the first poll
+    signature = store_signature(args.store)
+    try:
+        db = init_firebase()
+        print("Firebase initialized successfully")
+        engine = create_engine(db, args.store, args.target_ms, args.aggregation, args.live_templates,
+                               not args.no_motion_gate, args.match_server, kiosk=args.kiosk, wal_path=args.wal,
+                               index=args.index, nprobe=args.nprobe)
+    except Exception as e:
+        print(f"Error starting recognition engine: {e}")
+        return 1
+
+    # Closing the engine stops the student cache listener, which would otherwise keep the process alive
+    watcher = None
+    try:
+        cap, camera_index = open_camera(args.camera, kiosk=args.kiosk)
+        if cap is None:
+            print("Error: Could not open camera after multiple attempts")
+            return 1
+        engine.camera = f"cam{camera_index}"
+        # New enrollments are picked up without restarting; SIGHUP forces a check.
+        # A match server watches the gallery itself.
+        if not args.match_server:
+            watcher = GalleryWatcher(args.store, [engine], args.reload_interval, loaded=signature).start()
+            install_reload_signal(watcher)
+        run_headless(engine, cap, camera_index, args.stats_interval)
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        engine.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import copy
+import time
+import threading
+from collections import OrderedDict
+from metrics import METRICS
+
+
+class StudentCache:
+    """Size-bounded LRU cache of student records with a TTL
+
+    The whole Students node is prefetched in one read at startup and kept
+    fresh with a database listener, falling back to periodic polling when
+    listening is not available. While the listener runs it pushes every
+    change, so cached records never expire; the TTL only applies without it.
+    Records are returned as copies, so callers may modify them freely.
+    """
+
+    def __init__(self, db, root='Students', max_size=50000, ttl=600.0, poll_interval=60.0):
+        self.db = db
+        self.root = root
+        self.max_size = max_size
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.records = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.listener = None
+        self.poll_thread = None
+        self.running = False
+
+    def _store(self, student_id, record, now=None):
+        """Caller must hold the lock"""
+        student_id = str(student_id)
+        if record is None:
+            self.records.pop(student_id, None)
+            return
+        self.records[student_id] = (record, now if now is not None else time.monotonic())
+        self.records.move_to_end(student_id)
+        while len(self.records) > self.max_size:
+            self.records.popitem(last=False)
+            self.evictions += 1
+
+    def prefetch(self):
+        """Load every student record with a single read; returns the count loaded"""
+        with METRICS.time("db_read"):
+            students = self.db.reference(self.root).get() or {}
+        if isinstance(students, list):
+            students = {str(i): record for i, record in enumerate(students) if record is not None}
+        now = time.monotonic()
+        with self.lock:
+            for student_id, record in students.items():
+                self._store(student_id, record, now)
+        return len(students)
+
+    def get(self, student_id):
+        """Return a copy of the student's record, reading through to the database on a miss"""
+        student_id = str(student_id)
+        with self.lock:
+            entry = self.records.get(student_id)
+            if entry is not None and (self.listener is not None or time.monotonic() - entry[1] < self.ttl):
+                self.hits += 1
+                self.records.move_to_end(student_id)
+                return copy.deepcopy(entry[0])
+            self.misses += 1
+
+        with METRICS.time("db_read"):
+            record = self.db.reference(f'{self.root}/{student_id}').get()
+        with self.lock:
+            self._store(student_id, record)
+        return copy.deepcopy(record)
+
+    def record_mark(self, student_id, timestamp):
+        """Apply a locally queued attendance mark so duplicate checks see it before the database does"""
+        with self.lock:
+            entry = self.records.get(str(student_id))
+            if entry is None:
+                return
+            record = entry[0]
+            record['total_attendance'] = record.get('total_attendance', 0) + 1
+            record['last_attendance_time'] = timestamp
+
+    def start_refresh(self):
+        """Keep the cache fresh, preferring a push listener over polling"""
+        self.running = True
+        try:
+            self.listener = self.db.reference(self.root).listen(self._on_event)
+            return "listen"
+        except Exception as e:
+            print(f"Student cache listener unavailable ({e}), polling every {self.poll_interval:.0f}s")
+        self.poll_thread = threading.Thread(target=self._poll, name="student-cache-poll", daemon=True)
+        self.poll_thread.start()
+        return "poll"
+
+    def _poll(self):
+        while self.running:
+            time.sleep(self.poll_interval)
+            if not self.running:
+                break
+            try:
+                self.prefetch()
+            except Exception as e:
+                print(f"Error refreshing student cache: {e}")
+
+    def _on_event(self, event):
+        """Apply a Realtime Database listener event (put or patch) to the cache"""
+        parts = [part for part in event.path.split('/') if part]
+        now = time.monotonic()
+        with self.lock:
+            if not parts:
+                # Event on the root: data is the whole node (put) or a set of children (patch)
+                if event.event_type == 'put':
+                    self.records.clear()
+                for student_id, record in (event.data or {}).items():
+                    self._store(student_id, record, now)
+                return
+
+            student_id = parts[0]
+            if len(parts) == 1 and event.event_type == 'put':
+                self._store(student_id, event.data, now)
+                return
+
+            entry = self.records.get(student_id)
+            if entry is None:
+                return  # not cached; the next get() will read it
+            record = entry[0]
+            node = record
+            for part in parts[1:-1]:
+                node = node.setdefault(part, {})
+            if len(parts) == 1:
+                record.update(event.data or {})
+            elif event.event_type == 'patch':
+                node.setdefault(parts[-1], {}).update(event.data or {})
+            elif event.data is None:
+                node.pop(parts[-1], None)
+            else:
+                node[parts[-1]] = event.data
+            self._store(student_id, record, now)
+
+    def stats(self):
+        with self.lock:
+            return {"size": len(self.records), "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions}
+
+    def close(self):
+        self.running = False
+        if self.listener is not None:
+            self.listener.close()